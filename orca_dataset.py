@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+'''
+orca_dataset.py
+===============
+
+Reads and writes the memory-mappable dataset of `orca_orb.py` (`orca.out.dat`, `orca.out.mulliken.dat`).
+The module can be imported by other processes to map a dataset read-only:
+
+    from orca_dataset import open_dataset, dataset_tables
+    dataset = open_dataset('my-calc.out.dat')
+    orbitals, rows = dataset_tables(dataset)
+'''
+
+import os            # replace the dataset
+import json          # header
+import mmap          # read-only mapping
+import numpy as np   # numpy arrays
+import pandas as pd  # pandas tables
+
+# dataset: memory-mappable file with the orbitals of a section
+# a small header and raw (little-endian) arrays, every array starts at a multiple of 64 bytes
+#
+#   bytes 0-7   : b'ORCAORB1'
+#   bytes 8-15  : length of the header (uint64)
+#   bytes 16-   : header (JSON): number of rows and orbitals, categories (names of the
+#                 element, orbital and orb_red codes) and for every array dtype, offset 
+#                 (from the first 64 byte boundary after the header) and length
+#
+# per row     : atom_no, element, orbital, orb_red (codes), orb_comp
+# per orbital : orbital_spin, orbital_num, orbital_en, orbital_occ (in the order of the 
+#               ORCA output), orbital_row (first row of each orbital + total number of rows)
+#
+# the rows of an orbital are contiguous, orbital ranges are slices of the arrays
+dataset_magic = b'ORCAORB1'
+
+# first multiple of 64 bytes >= pos
+def align64(pos):
+    return -(-pos // 64) * 64
+
+# write oall and the orbitals (from read_orbitals) as dataset
+def write_dataset(filename, oall, orbitals):
+    rows = dict(atom_no=oall.atom_no.values.astype('<i4'), orb_comp=oall.orb_comp.values.astype('<f8'))
+    categories = {}
+    for col in ('element','orbital','orb_red'):
+        if isinstance(oall[col].dtype, pd.CategoricalDtype): # codes of the table, no second factorize
+            codes, uniques = oall[col].cat.codes.values, oall[col].cat.categories
+        else:
+            codes, uniques = pd.factorize(oall[col])
+        rows[col] = codes.astype('<i2')
+        categories[col] = list(uniques)
+    write_dataset_rows(filename, rows, categories, orbitals)
+
+# write the rows (atom_no, orb_comp and the codes of element, orbital, orb_red), 
+# the categories and the orbitals (from read_orbitals) as dataset
+def write_dataset_rows(filename, rows, categories, orbitals):
+    orbitals = orbitals.sort_values('row_start') # order of the ORCA output
+    arrays = dict(orbital_spin=orbitals.orb_spin.values.astype('<i1'),
+                  orbital_num=orbitals.orb_num.values.astype('<i4'),
+                  orbital_en=orbitals.orb_en.values.astype('<f8'),
+                  orbital_occ=orbitals.orb_occ.values.astype('<f4'),
+                  orbital_row=np.append(orbitals.row_start.values, len(rows['atom_no'])).astype('<i8'))
+    arrays.update(rows)
+
+    offsets = {}
+    offset = 0
+    for name, array in arrays.items():
+        offsets[name] = offset
+        offset = align64(offset + array.nbytes)
+    header = json.dumps(dict(rows=len(rows['atom_no']), orbitals=len(orbitals), categories=categories,
+                             arrays={name: [array.dtype.str, offsets[name], len(array)] 
+                                     for name, array in arrays.items()})).encode()
+
+    # written to a temporary file first and then replaces the dataset, processes that have 
+    # mapped the old dataset keep their (complete) copy
+    temp_name = f'{filename}.{os.getpid()}.tmp'
+    with open(temp_name,'wb') as f:
+        f.write(dataset_magic + len(header).to_bytes(8,'little') + header)
+        data = align64(f.tell())
+        for name, array in arrays.items():
+            f.seek(data + offsets[name])
+            f.write(array.tobytes())
+        f.truncate(data + offset) # padding of the last array
+    os.replace(temp_name, filename)
+
+# map a dataset read-only, returns a dict of arrays (views of the mapped file) and 'categories'
+# all processes that open the same dataset share one copy in memory
+def open_dataset(filename):
+    with open(filename,'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) # stays valid after closing the file
+    if mm[:8] != dataset_magic:
+        raise ValueError(filename+' is not a dataset')
+    header_len = int.from_bytes(mm[8:16],'little')
+    header = json.loads(mm[16:16+header_len])
+    data = align64(16 + header_len)
+    dataset = {name: np.frombuffer(mm, dtype=dtype, count=count, offset=data+offset) 
+               for name, (dtype, offset, count) in header['arrays'].items()}
+    dataset['categories'] = header['categories']
+    return dataset
+
+# tables of the orbitals and the rows of a dataset, nothing is copied per row
+# row_ranges: list of (first, last+1) rows at orbital boundaries, default all rows
+# orbitals: orb_num, orb_spin, orb_en, orb_occ and row_start, row_end (first and last+1 row of the 
+#           orbital in rows), one row per orbital
+# rows    : atom_no, element, orb_red, orbital (codes of the dataset, names in dataset['categories']), orb_comp
+# for one range all columns are views of the mapped arrays (all processes share one copy), 
+# several ranges are copied into one table
+def dataset_tables(dataset, row_ranges=None):
+    orbital_row = dataset['orbital_row']
+    if row_ranges is None:
+        row_ranges = [(0, orbital_row[-1])]
+    orbitals, rows = [], []
+    n_rows = 0
+    for first, last in list(row_ranges) or [(0, 0)]: # (0, 0): no rows
+        orb_first, orb_last = np.searchsorted(orbital_row, [first, last])
+        bounds = orbital_row[orb_first:orb_last + 1] - first + n_rows
+        orbitals.append(dict(orb_num=dataset['orbital_num'][orb_first:orb_last],
+                             orb_spin=dataset['orbital_spin'][orb_first:orb_last],
+                             orb_en=dataset['orbital_en'][orb_first:orb_last],
+                             orb_occ=dataset['orbital_occ'][orb_first:orb_last],
+                             row_start=bounds[:-1], row_end=bounds[1:]))
+        rows.append({col: dataset[col][first:last] for col in ('atom_no','element','orb_red','orbital','orb_comp')})
+        n_rows += last - first
+    # copy=False: no consolidation of the columns, views stay views
+    return tuple(pd.DataFrame(parts[0] if len(parts) == 1 else 
+                              {col: np.concatenate([part[col] for part in parts]) for col in parts[0]}, copy=False)
+                 for parts in (orbitals, rows))
+
+# table oall of a dataset with the columns of the CSV file (see dataset_tables for row_ranges)
+# the orbital columns are repeated for every row, element, orb_red and orbital are strings and 
+# integers are int64, the table is a private copy of each process
+def dataset_frame(dataset, row_ranges=None):
+    orbitals, rows = dataset_tables(dataset, row_ranges)
+    n_rows = (orbitals.row_end - orbitals.row_start).values
+    oall = {col: np.repeat(orbitals[col].values, n_rows).astype(dtype)
+            for col, dtype in (('orb_num','int64'), ('orb_spin','int64'), ('orb_en','float64'), ('orb_occ','float32'))}
+    oall['atom_no'] = rows.atom_no.values.astype('int64')
+    for col in ('element','orb_red','orbital'):
+        oall[col] = np.array(dataset['categories'][col], dtype=object)[rows[col].values]
+    oall['orb_comp'] = rows.orb_comp.values
+    return pd.DataFrame(oall, copy=False)
@@ -3,7 +3,8 @@
 orca_orb.py 
 ===========
 
-Analyzes the section 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO' in ORCA output files.
+Analyzes the section 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO' (or 'MULLIKEN REDUCED ORBITAL 
+POPULATIONS PER MO') in ORCA output files.
 
 ORCA: https://orcaforum.kofo.mpg.de/
 
@@ -14,7 +15,7 @@ Usage:
     
     (python) orca_orb.py -options ORCA.out
 
-Options are `-t`, `-o`, `-c`, `-a`, -`ncsv` (see below).
+Options are `-t`, `--threshold-sweep`, `--sweep-step`, `-o`, `-e`, `-c`, `-a`, `-k`, `-f`, `-p`, `--project`, `-b`, `-g`, `-d`, `--compare-spins`, `-l`, `--localization`, `--min-ipr`, `-s`, -`ncsv`, `-j`, `-m`, `-i`, `-x`, `--cache-dir`, `--cache-size` (see below).
 
 
 Naming conventions
@@ -48,13 +49,49 @@ be printed. The threshold is not valid for the first (two) tables (element contr
 and the bar plot(s).
 
 
+Threshold sweep (--threshold-sweep, --sweep-step)
+-------------------------------------------------
+With `--threshold-sweep` the program helps to choose a threshold. For thresholds from 0 to 100% (in steps of 
+1% or the step given with `--sweep-step`) it lists how many entries of the summaries of atom, reduced AO and AO contributions 
+are printed, their share of all contributions (in %) and the estimated size of `o-analysis.txt`. 
+Orbital range, energy window and constraints are applied. The table is written to `o-sweep.txt` and plotted 
+in `th-sweep.png` (the given threshold `-t` is marked). There is no analysis. The contributions of each 
+summary are summed up and sorted once, so the sweep is faster than a single analysis.
+
+Examples:
+    
+    --threshold-sweep                          : thresholds 0, 1, 2, ... 100%
+    --threshold-sweep --sweep-step 0.5 -oh10   : thresholds 0, 0.5, 1, ... 100% for the orbitals HOMO-10 to HOMO+10
+
+
+Top contributions (-k, --top)
+-----------------------------
+For large systems the summaries of atom and AO contributions can be very long, even with a threshold.
+With the `-k (--top)` parameter only the K largest atom, reduced AO (s, p, d, f of an atom) and AO 
+contributions to each orbital are listed, together with the leftover ('Rest') of the orbital, which is 
+the sum of all other contributions. These tables replace the summaries of atom and AO contributions in 
+`o-analysis.txt`, so the output has at most K+1 lines per orbital and table. Threshold and constraints are 
+valid for the listed contributions, the leftover includes all contributions that are not listed (also the 
+ones below the threshold), so the listed contributions and the leftover add up to the orbital. The plots are 
+not affected.
+The K largest contributions are picked from the summed contributions of each orbital by a partial selection 
+(no sorting of complete tables).
+
+Examples:
+    
+    -k3      : lists the three largest contributions to each orbital
+    -k5 -cC  : lists the five largest contributions of carbon atoms to each orbital
+
+
 Bar plot(s)
 -----------
 The bar plot `el-cntrb-a.png` visualizes the contribution (in %) of elements to orbitals. A given
 threshold or constraints are not valid for this plot. In case of spin unrestricted calculations 
 respective plots for alpha (...-a.png) and beta (...-b.png) orbitals will be created.
+If fragments are defined (see below), the bar plot `fr-cntrb-a.png` visualizes the contribution of 
+fragments to orbitals in the same way.
 
-Restarting the program deletes all plots.
+Restarting the program deletes all plots that are not created again (see 'Plot manifest').
 
 
 Heat map(s)
@@ -74,14 +111,28 @@ below a given threshold in the selected orbital range.
 In case of spin unrestricted calculations respective plots for alpha (...-a.png) and beta (...-b.png) 
 orbitals will be created. 
 
-Restarting the program deletes all plots.
+Restarting the program deletes all plots that are not created again (see 'Plot manifest').
+
+Plot manifest
+-------------
+Drawing the plots takes most of the time of an analysis. Therefore the file `o-plots.json` is written next to 
+the plots. It keeps a key (hash) of the plotted data and the settings of each plot (e.g. title, threshold, 
+constraints, heat map annotations). A plot is only drawn again if its key has changed or the plot is missing. 
+For example, changing the constraints (`-c`) redraws the heat maps of the atom contributions, but not the bar 
+plot(s) of the element contributions, and changing the atoms after `-a` only draws the heat maps of the new atoms.
+Plots of previous runs that are not created again are deleted at the end of the program. Deleting `o-plots.json`
+redraws all plots.
+Runs without analysis (`-i`, `-x`, `--threshold-sweep`, `--localization`) neither draw nor delete plots. The plots 
+are kept on purpose: together with `o-analysis.txt`, which is not written by these runs either, they always 
+belong to the last analysis, not to the files written by these runs (`o-sweep.txt`, `th-sweep.png`, 
+`o-localization.txt`).
 
 
 Orbital range (-o, --orbitals)
 ------------------------------
 A range of orbitals can be defined with the `-o (--orbitals)` parameter. It should be noted that all
 orbitals from the ORCA output will be processed first and that the orbital selection is done in a
-second step. 
+second step. Only the rows of the orbitals in the range are then taken from the dataset (see below).
 At least one argument is expected after `-o`. If the `-o` parameter is not given all orbitals will 
 be included in the analysis.
 
@@ -93,6 +144,30 @@ Examples:
     -o0-10 or o0:10: processes all orbitals from 0 to 10
 
 
+Energy window (-e, --energy-window)
+-----------------------------------
+Orbitals can also be selected by their energy with the `-e (--energy-window)` parameter. The window is
+given in Eh, or in eV if 'eV' is appended. With 'gap' the window extends from the energy of the HOMO 
+minus the given value to the energy of the LUMO plus the given value. In case of spin unrestricted 
+calculations HOMO and LUMO are taken across both spins (highest occupied and lowest virtual orbital of 
+alpha and beta orbitals), so the window is the same for both spins. Alpha and beta orbitals are selected
+separately by their energies in this window. If `-o` is given as well, only orbitals in the orbital range and in the 
+energy window will be analyzed. Since the window can start with a minus sign, use `-e-0.3:0.1` or 
+`--energy-window=-0.3:0.1`.
+The energies of all orbitals are kept sorted in the cache record of the CSV file (see below). If the CSV 
+file is valid, only the orbitals in the energy window are taken from the dataset (see below). The first run 
+(no valid CSV file) still reads the whole section, because the CSV file and the dataset hold all orbitals, 
+so only later runs benefit from the energy window. With a memory limit (`-m`) the first run can read the 
+section in chunks and analyze the window without the table of all orbitals in memory.
+
+Examples:
+    
+    -e-0.3:0.1     : processes all orbitals from -0.3 to 0.1 Eh
+    -e-8:-2eV      : processes all orbitals from -8 to -2 eV
+    -egap0.1       : processes all orbitals from E(HOMO)-0.1 Eh to E(LUMO)+0.1 Eh
+    -egap2eV       : processes all orbitals from E(HOMO)-2 eV to E(LUMO)+2 eV
+
+
 Atom or element constraints (-c, --constraints)
 -----------------------------------------------
 Analysis can be constrained to selected elements or atoms using the `-c (--constraints)` parameter. Elements 
@@ -134,14 +209,245 @@ Examples:
     -cCu -a1 : not possible if atom 1 is not copper
     
 
+Fragments (-f, --fragments)
+---------------------------
+Atoms can be combined to named fragments, e.g. 'metal', 'Cp ring 1' or 'axial ligand', with the 
+`-f (--fragments)` parameter. The fragments are read from a file with one fragment per line (`name: atoms`, 
+'#' starts a comment) or are given directly as `name=atoms;name=atoms`. Atoms are atom numbers, ranges of 
+atom numbers (`1-5`) or elements (`Fe`), separated by commas or spaces. Atoms that are not part of any
+fragment are summed up in the fragment 'Rest'. 
+The contributions of the fragments to the orbitals are listed in `o-analysis.txt` after the element 
+contributions and are plotted in `fr-cntrb-a.png` (see 'Bar plot(s)'). Threshold and constraints are not 
+valid for the fragment contributions. The fragments are translated once to a matrix (atoms x fragments), 
+the contributions of all fragments to all orbitals are the product of the atom contributions and this matrix.
+
+Example file `frag.txt`:
+
+    # ferrocene
+    metal:     0
+    Cp ring 1: 1-5, 11-15
+    Cp ring 2: 6-10, 16-20
+
+Examples:
+    
+    -f frag.txt           : fragments from the file frag.txt
+    -f "metal=Fe;Cp=C,H"  : fragments 'metal' (all Fe atoms) and 'Cp' (all C and H atoms)
+    
+
+PDOS (-p, --pdos, --project, -b, --broadening, -g, --grid)
+----------------------------------------------------------
+The `-p (--pdos)` parameter writes the projected density of states (PDOS) of the analyzed orbitals (orbital
+range and energy window) to `pdos-a.csv` and plots it in `pdos-a.png`. The energies of the orbitals are broadened 
+with Gaussian or Lorentzian functions and projected onto elements (default), atoms, shells (s, p, d, f of an atom) 
+or fragments (see above), as selected with `--project`. The weight of an orbital in a projection is its contribution in '%' / 100. The column 
+'Total' is the density of states of all analyzed orbitals (each orbital counts once, also in case of 
+spin restricted calculations). Energies are given in eV, the PDOS in 1/eV. Threshold and constraints are not 
+valid for the PDOS. In case of spin unrestricted calculations respective tables and plots for alpha (...-a) 
+and beta (...-b) orbitals will be created. Tables and plots of previous runs that are not created again are 
+deleted at the end of the program.
+
+The broadening function and its full width at half maximum (FWHM) are given with `-b (--broadening)` in Eh, 
+or in eV if 'eV' is appended (default: `gauss0.3eV`). The energy grid is given with `-g (--grid)` as 
+`low:high:step` in Eh, or in eV if 'eV' is appended. Without `-g` the grid covers the energies of the analyzed 
+orbitals +/- 3 FWHM in steps of FWHM/10. The orbitals are distributed to the grid points first, then all 
+projections are broadened at once by a convolution (FFT). 
+
+Examples:
+    
+    -p                                   : PDOS projected onto elements (Gaussian functions, FWHM 0.3 eV)
+    -p --project atom -b lorentz0.2eV    : PDOS projected onto atoms (Lorentzian functions, FWHM 0.2 eV)
+    -p --project shell --grid=-20:5:0.01eV : PDOS projected onto shells from -20 to 5 eV in steps of 0.01 eV
+    -p --project fragment -f frag.txt    : PDOS projected onto the fragments in frag.txt
+    
+
+Compare mode (-d, --compare, --compare-spins, -l, --align)
+-----------------------------------------------------------
+The `-d (--compare)` parameter with the name of another ORCA output compares the element, atom and reduced AO 
+(s, p, d, f of an atom) contributions of the orbitals of both calculations (e.g. two spin states of the same 
+complex, same spin is compared). The `--compare-spins` option compares the contributions of alpha and beta 
+orbitals (spin unrestricted calculations) instead. The CSV file of the other ORCA output must exist (run `orca_orb.py` with the other ORCA output 
+first). The differences (alpha - beta, or this - other ORCA output) are listed in `o-analysis.txt`. Element 
+differences are listed for all orbitals in the range, atom and reduced AO differences if their absolute value 
+is equal or higher than the threshold. Constraints are not valid for the comparison.
+The heat map `cmp-cntrb-a.png` shows the differences of the atom contributions (red: higher contribution, blue: 
+lower contribution than in the compared orbital).
+
+With `-l (--align)` the orbitals are aligned by orbital number (`index`, default) or by energy (`energy`, the 
+compared orbital has the nearest energy). Both orbital numbers and energies are listed. Orbital range and 
+energy window only select the orbitals of this ORCA output (alpha orbitals with `--compare-spins`), the 
+compared orbitals are taken from all orbitals.
+
+Examples:
+    
+    --compare-spins          : compares alpha and beta orbitals
+    -d my-hs.out -l energy   : compares with the orbitals of my-hs.out with the nearest energy
+    -d my-hs.out -oh5 -t5    : compares orbitals from HOMO-5 to HOMO+5 with the orbitals of 
+                               my-hs.out, differences >= 5% of atoms and AOs are listed
+    
+
+Localization (--localization, --min-ipr)
+----------------------------------------
+The `--localization` option tells for each orbital (and spin) how localized it is. From the shares p of 
+the atoms in an orbital (atom contribution / sum of all atom contributions) the inverse participation 
+ratio IPR = sum(p^2) (1 for an orbital on one atom, 1/N for an orbital spread equally over N atoms) and 
+the Shannon entropy -sum(p ln p) (0 for one atom, ln N for N atoms) are calculated. With fragments (`-f`) 
+the IPR of the fragment shares is given as well. The element with the largest share and its share (in %) 
+complete the table, which is written to `o-localization.txt`. There is no analysis. Orbital range and 
+energy window are applied, constraints and threshold are not. With `--min-ipr` (0...1) only orbitals 
+with IPR >= MIN_IPR are listed. All values are sums over the (orbital, atom) pairs of the table, so this 
+is fast even for large sections.
+
+Examples:
+    
+    --localization                  : localization of all orbitals
+    --localization --min-ipr 0.5 -oh10 : orbitals from HOMO-10 to HOMO+10 with IPR >= 0.5
+    --localization -f frag.txt -oh5 : localization of orbitals from HOMO-5 to HOMO+5 (with fragments)
+    
+
+Population scheme (-s, --scheme)
+--------------------------------
+ORCA can print 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO' and 'MULLIKEN REDUCED ORBITAL POPULATIONS PER MO'.
+The `-s (--scheme)` parameter selects the section for the analysis and the plots (default: `loewdin`). 
+All sections found in the ORCA output are read at once and each section is written to its own CSV file 
+(`orca.out.csv` for Loewdin, `orca.out.mulliken.csv` for Mulliken populations). Switching the scheme 
+afterwards does not read the ORCA output again.
+
+Examples:
+    
+    -s mulliken : analysis of the Mulliken reduced orbital populations
+    -s loewdin  : analysis of the Loewdin reduced orbital populations (default)
+
+
 CSV file and -ncsv (--newcsv) option
 ------------------------------------
 In a first step all information listed under 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO' will be read,
-and written to a large table. The naming scheme is `orca.out.csv`. In subsequent analyses the program
+and written to a large table. The naming scheme is `orca.out.csv` (`orca.out.mulliken.csv` for 
+'MULLIKEN REDUCED ORBITAL POPULATIONS PER MO'). In subsequent analyses the program
 uses this file which makes analyses much faster. For creating a new CSV file, the option `-ncsv` can be used.
 
-If you restart a calculation with different parameters you should always use the `-ncsv` option, otherwise
-the program uses a previous `orca.out.csv` which does not agree with the result of the recent calculation.
+Together with the CSV file a small cache record `orca.out.csv.json` is written. It keeps the size and a 
+fingerprint of the ORCA output the CSV file was built from and the energies of all orbitals. If the ORCA output has been changed, a new CSV 
+file is built. If the ORCA output has only grown (restarted or continued calculation in the same output file), 
+only the appended part is searched for new 'LOEWDIN/MULLIKEN REDUCED ORBITAL POPULATIONS PER MO' sections. The CSV file 
+is updated if a new section has been found. A CSV file without cache record is replaced by a new one.
+
+
+Info (-i, --info)
+-----------------
+With the CSV file a small info record `orca.out.csv.info.json` is written. It contains the number of alpha 
+and beta orbitals, HOMO and LUMO (number and energy) of each spin, the orbital energy range, elements and 
+atoms. The `-i (--info)` option prints this information without any analysis or plots. If the info record
+matches the ORCA output the answer is instant, otherwise the CSV file is built first.
+
+Example:
+    
+    orca_orb.py -i my-calc.out
+
+
+Dataset
+-------
+Besides the CSV file a memory-mappable dataset `orca.out.dat` (`orca.out.mulliken.dat`) is written. 
+It holds the same table as raw arrays after a small header (the layout is described in `orca_dataset.py`,
+see `write_dataset_rows`). The program uses the dataset instead of reading the CSV file. 
+`orca_dataset.py` must be in the same folder as `orca_orb.py`. Other processes can import it and map the 
+dataset read-only. All processes then share one copy of the data in memory and orbital ranges are slices 
+of the arrays without copies. `dataset_tables` returns a table of the orbitals (one row per orbital, with the 
+first and last+1 row of each orbital) and a table of the rows. All columns of both tables are views of the 
+mapped arrays, `element`, `orb_red` and `orbital` are the codes of the dataset, so a process holds nothing 
+per row. `dataset_frame` returns the table of the CSV file (orbital columns repeated for every row, labels 
+as strings), which is a private copy of each process. Example:
+
+    from orca_dataset import open_dataset, dataset_tables
+    dataset = open_dataset('my-calc.out.dat')   # dict of numpy arrays (read-only views of the file)
+    orbitals, rows = dataset_tables(dataset)     # pandas tables (views of the file)
+    first, last = orbitals.row_start[0], orbitals.row_end[0]
+    rows[first:last]                             # rows of the first orbital
+    dataset['categories']['element'][rows.element[0]] # name of the element of the first row
+
+
+Arrow export (-x, --export)
+---------------------------
+The `-x (--export)` option writes all rows of the CSV file (all orbitals of the section) as Arrow IPC 
+stream to a file or to stdout (`-x -`, messages are then printed to stderr). There is no analysis and no 
+plot. The stream is written record batch by record batch (whole orbitals, about 1M rows per batch) 
+directly from the dataset, so the export itself never holds the whole section in memory. The first run 
+(no valid CSV file) still reads the section for the CSV file and the dataset first, which holds the table 
+of all orbitals in memory unless the section is read in chunks (memory limit `-m`, see below). For very 
+large sections use `-m` with the first export. The columns are the columns of the CSV file, `element`, 
+`orb_red` and `orbital` are dictionary encoded. The info record (see `-i`) is kept as JSON in the schema 
+metadata (key `orca_orb`). The export needs `pyarrow`.
+
+Examples:
+    
+    orca_orb.py my-calc.out -x my-calc.arrows   : export to my-calc.arrows
+    orca_orb.py my-calc.out -x - | consumer.py  : export to stdout
+
+The exported file can be memory-mapped, e.g. `pyarrow.ipc.open_stream(pyarrow.memory_map('my-calc.arrows'))`.
+
+
+Parallel reading (-j, --jobs)
+-----------------------------
+The orbitals in 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO' are printed in blocks of a few orbitals.
+Blocks are independent of each other and can be read by several processes (`-j` or `--jobs`), which 
+is useful for very large ORCA outputs. The result is identical to reading with one process (default). 
+The processes only send numbers (atom numbers, codes of the AO labels and contributions) back. The table 
+is assembled from these codes (no strings per row) and the codes are written to the dataset as they are. The 
+CSV file is formatted by the same number of processes in slices, which are written in order.
+Parallel reading is not available on Windows.
+
+Examples:
+    
+    -j8      : read orbitals with 8 processes
+
+
+Memory limit (-m, --memory-limit)
+---------------------------------
+Before a section is read, its size is estimated from its byte range in the ORCA output and the rows of 
+its first block (about 300 bytes of memory per row). With a memory limit (`-m` or `--memory-limit`, units 
+B, KB, MB, GB, TB, default MB) the program chooses how to read the section:
+
+    parallel : large sections (> 64 MB) that fit into memory, with -j processes (or all CPUs)
+    memory   : sections that fit into memory, one process
+    chunked  : chunks of the section (as large as the memory limit allows) are read one after 
+               the other and appended to the CSV file, only codes are kept for the dataset
+
+The chosen way is printed. CSV file and dataset do not depend on it. Without memory limit the section is 
+read in memory (in parallel with `-j`).
+The analysis needs the table of the rows of the orbitals in the range and the window in memory (all rows 
+for all orbitals). If it does not fit into the memory limit (also if the CSV file already exists) the 
+program quits and asks for a smaller `-o` (orbital range) or `-e` (energy window), `-i` or `-x` (no table 
+at all). The same holds for the rows of the compared orbitals with `-d` or `--compare-spins`, only the 
+orbitals aligned to the orbitals in the range are taken from the dataset.
+
+Examples:
+    
+    -m4GB    : read the section within 4 GB of memory
+
+
+Cache directory (--cache-dir, --cache-size)
+-------------------------------------------
+By default the CSV file, the dataset and the records are written next to the ORCA output. With 
+`--cache-dir` (or the environment variable `ORCA_ORB_CACHE`) they are kept in a central cache directory 
+instead. Every ORCA output gets an entry (a folder named after its fingerprint), which is listed in 
+`index.json` of the cache directory with the path of the ORCA output, the size of the entry and the time 
+of the last use. A copied or moved ORCA output finds its entry by the fingerprint, a grown ORCA output by 
+its path. If the cache directory exceeds `--cache-size` (default 10GB, units B, KB, MB, GB, TB), the least 
+recently used entries are deleted. The entries of the current run are never deleted.
+Several runs can use the same cache directory at the same time, `index.json` is locked while it is changed
+(`index.json.lock`, not on Windows). Each run marks its entries as used when it starts and holds a lease 
+(a lock of `entry.lock` next to the entry folder, not on Windows) until it ends. Entries with a lease are not 
+deleted by other runs or by `orca_orb.py cache prune`, even if they are the least recently used. Entry folders that are missing in `index.json` (e.g. after a crash) are 
+added again when the cache directory is pruned. Entries of folders that were deleted by hand are dropped 
+from `index.json` and the ORCA output gets a new entry.
+
+`orca_orb.py cache stats` lists the entries of the cache directory, `orca_orb.py cache prune` deletes 
+least recently used entries until the cache directory fits into `--cache-size`.
+
+Examples:
+    
+    --cache-dir ~/orca-cache              : keep CSV files and datasets in ~/orca-cache
+    orca_orb.py cache stats               : list the entries of the cache directory
+    orca_orb.py cache prune --cache-size 2GB : shrink the cache directory to 2 GB
 
 
 Known issues
@@ -149,9 +455,9 @@ Known issues
 The plot section crashes without notice if a large number of orbitals (~1000) is processed. Plot artifacts
 may occur at even lower numbers of orbitals. The text out is not affected.
 
-The program favor an existing `orca.out.csv` over creating a new one. Besides filenames the program
-does not check whether the recent ORCA output matches the CSV file. Using the `-ncsv` option (forces the 
-program to create a new CSV file) solves the issue.
+The fingerprint of the ORCA output only covers its size and its first and last 64 kB. Changes in the middle 
+of an ORCA output with unchanged size are not detected. Using the `-ncsv` option (forces the program to 
+create a new CSV file) solves the issue.
 
                                                                                               
 Example inputs
@@ -217,41 +523,23 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 
 import os     as ops # for file checking
 import glob          # for file checking
+import sys           # for the cache subcommand
+import shutil        # for the cache directory
+import time          # for the cache directory
+import contextlib    # lock of the cache directory
+import importlib.util # check for pyarrow (export)
+try:
+    import fcntl     # lock of the cache directory (not available on Windows)
+except ImportError:
+    fcntl = None
 
 import argparse      # argument parser
 import re            # regex
-import pandas as pd  # pandas tables
-import seaborn as sns; sns.set(context='paper',font_scale=0.7) # for the plots
-import matplotlib.pyplot as plt                                # for the plots
-
-
-# do not truncate tables
-pd.set_option('display.max_columns',9)
-pd.set_option('display.width',1000)
-pd.set_option('display.max_rows',None)
-
-
-# tidy up plots
-# delete all previous plots
-if ops.path.exists('el-cntrb-a.png'):
-    ops.remove('el-cntrb-a.png')
-    
-if ops.path.exists('el-cntrb-b.png'):
-    ops.remove('el-cntrb-b.png')
-
-if ops.path.exists('a-cntrb-a.png'):
-    ops.remove('a-cntrb-a.png')
-    
-if ops.path.exists('a-cntrb-b.png'):
-    ops.remove('a-cntrb-b.png')
-    
-if glob.glob('ao-cntrb-*-a.png'):
-    for pngfiles in glob.glob('ao-cntrb-*-a.png'):
-        ops.remove(pngfiles)
-
-if glob.glob('ao-cntrb-*-b.png'):
-    for pngfiles in glob.glob('ao-cntrb-*-b.png'):
-        ops.remove(pngfiles)
+import hashlib       # fingerprint of the ORCA output for the CSV file
+import json          # cache record of the CSV file
+import mmap          # fast search for the section in large files
+import multiprocessing as mp                    # parallel reading of orbitals
+from concurrent.futures import ProcessPoolExecutor
 
 
 # check threshold from argparse
@@ -261,25 +549,945 @@ def threshold_check(string):
         raise argparse.ArgumentTypeError(f"{value}% exceeds range. Quit." )
     return value
 
+# check threshold step for --threshold-sweep from argparse
+def sweep_check(string):
+    value = float(string)
+    if value <= 0 or value > 100: 
+        raise argparse.ArgumentTypeError(f"Step {value}% exceeds range. Quit." )
+    return value
+
+# check min. IPR for --localization from argparse
+def ipr_check(string):
+    value = float(string)
+    if value < 0 or value > 1: 
+        raise argparse.ArgumentTypeError(f"IPR {value} exceeds range (0...1). Quit." )
+    return value
+
+# check number of contributions for --top from argparse
+def top_check(string):
+    value = int(string)
+    if value < 1: 
+        raise argparse.ArgumentTypeError(f"{value} contributions are not possible. Quit." )
+    return value
+
+# check broadening for --pdos from argparse
+# 'gaussX' or 'lorentzX' with the FWHM X in Eh, or in eV with 'eV' at the end
+# returns (shape, fwhm) with the FWHM in Eh
+def broadening_check(string):
+    broadening = re.fullmatch(r'(gauss|lorentz)?(\d*\.?\d+)(eV|Eh)?', string, re.IGNORECASE)
+    if broadening is None or float(broadening.group(2)) == 0:
+        raise argparse.ArgumentTypeError(f"Malformed broadening {string}. Quit.")
+    fwhm = float(broadening.group(2))
+    if broadening.group(3) and broadening.group(3).lower() == 'ev':
+        fwhm = fwhm / hartree_to_ev
+    return (broadening.group(1) or 'gauss').lower(), fwhm
+
+# check energy grid for --pdos from argparse
+# 'low:high:step' in Eh, or in eV with 'eV' at the end
+# returns (low, high, step) in Eh
+def grid_check(string):
+    grid = re.fullmatch(r'([-+]?\d*\.?\d+):([-+]?\d*\.?\d+):(\d*\.?\d+)(eV|Eh)?', string, re.IGNORECASE)
+    if grid is None or float(grid.group(1)) >= float(grid.group(2)) or float(grid.group(3)) == 0:
+        raise argparse.ArgumentTypeError(f"Malformed energy grid {string}. Quit.")
+    low, high, step = map(float, grid.group(1, 2, 3))
+    if grid.group(4) and grid.group(4).lower() == 'ev':
+        low, high, step = low / hartree_to_ev, high / hartree_to_ev, step / hartree_to_ev
+    return low, high, step
+
+# check energy window from argparse
+# 'low:high' or 'gapX' in Eh, or in eV with 'eV' at the end
+# returns (gap, low, high) in Eh, gap is True for 'gapX' (low = high = X)
+def energy_window_check(string):
+    window = re.fullmatch(r'(gap)?([-+]?\d*\.?\d+)(?::([-+]?\d*\.?\d+))?(eV|Eh)?', string, re.IGNORECASE)
+    if window is None or bool(window.group(1)) == bool(window.group(3)):
+        raise argparse.ArgumentTypeError(f"Malformed energy window {string}. Quit.")
+    gap = bool(window.group(1))
+    low = float(window.group(2))
+    high = low if gap else float(window.group(3))
+    if window.group(4) and window.group(4).lower() == 'ev':
+        low, high = low / hartree_to_ev, high / hartree_to_ev
+    if low > high or (gap and low < 0):
+        raise argparse.ArgumentTypeError(f"Malformed energy window {string}. Quit.")
+    return gap, low, high
+
+# check fragments from argparse
+# a file with one fragment per line 'name: atoms' ('#' starts a comment)
+# or 'name=atoms;name=atoms' on the command line
+# atoms are atom numbers, ranges of atom numbers (1-5) or elements (Fe), separated by commas or spaces
+# returns a list of (name, [atoms])
+def fragments_check(string):
+    if ops.path.isfile(string):
+        with open(string) as fragment_file:
+            entries = [line.split('#')[0].replace(':', '=', 1) for line in fragment_file]
+    else:
+        entries = string.split(';')
+    fragments = []
+    for entry in entries:
+        if not entry.strip():
+            continue
+        name, sep, atoms = entry.partition('=')
+        atoms = re.split(r'[,\s]+', atoms.strip())
+        if (not sep or not name.strip() or 
+            not all(re.fullmatch(r'\d+(-\d+)?|[A-Z][a-z]?', atom) for atom in atoms)):
+            raise argparse.ArgumentTypeError(f"Malformed fragment {entry.strip()}. Quit.")
+        fragments.append((name.strip(), atoms))
+    if not fragments:
+        raise argparse.ArgumentTypeError(f"No fragments in {string}. Quit.")
+    return fragments
+
 
 # variables - probably not all of them are necessary - some of them are just reminders
-loewdin_last = False            # for detecting the last occurence of look_for_loewdin
-look_for_loewdin = 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO'
-is_empty_line = False           # empty line bool in orbital table creation
-emptyline = re.compile('^\s*$') # empty line detect in orbital table creation
-emptyline_count = 0             # empty line count in orbital table creation
-raworbitals = []                # raworbitals reset
-first_time = False              # for data frame initialization
-spin=0                          # bool if beta orbitals are present
+section_last = False            # for detecting the last occurence of the section
+# supported sections (population schemes)
+look_for_sections = {'loewdin' : 'LOEWDIN REDUCED ORBITAL POPULATIONS PER MO',
+                     'mulliken': 'MULLIKEN REDUCED ORBITAL POPULATIONS PER MO'}
+emptyline = re.compile(rb'^[ \t\r\f\v]*$', re.M) # empty line detect in orbital table creation
+spin=0                          # bool if beta orbitals are analyzed
+unrestricted=0                  # bool if beta orbitals are present (spin unrestricted calculation)
 old_csv=0                       # old csv detected in folder
 heatmap_ano=True                # for heat map annotations
 constr_for_atoms_set=False      # for telling the plot section to plot the AOs of the selected atom
 hm_ano_font_size = 4            # font size for heat maps
+fp_chunk = 65536                # bytes from the start and the end of the ORCA output for the fingerprint
+cache_version = 3               # version of the cache record, older records are not used
+cache_size = 10 * 2**30         # default size limit of the cache directory (bytes)
+cache_prefixes = {}             # ORCA output: prefix of its cache files in the cache directory
+cache_leases = {}               # entry: lease file (shared lock) of the entries used by this run
+hartree_to_ev = 27.211386245988 # 1 Eh in eV
+top_chunk = 2**24               # max. cells (orbitals x contributors) per chunk for --top
+pdos_pad = {'gauss': 10, 'lorentz': 100} # grid padding (in FWHM) for orbitals outside of the PDOS grid
+pdos_points = 20000             # max. number of points of the default PDOS energy grid
+plot_manifest_name = 'o-plots.json' # file name of each plot -> key of its data and render settings
+plot_version = 1                # part of every plot key, increase if the plot code changes
+export_batch_rows = 2**20       # max. rows per record batch of the Arrow export (whole orbitals)
+memory_row_bytes = 300          # peak memory per row if a section is read in memory (table, CSV file, dataset)
+chunked_row_bytes = 40          # memory per row if a section is read in chunks (codes for the dataset)
+parallel_memory_factor = 1.5    # memory of parallel reading relative to reading in memory
+parallel_min_bytes = 2**26      # min. size of a section (bytes) for parallel reading with --memory-limit
+# columns of oall for the analysis (renamed)
+oall_columns = {'orb_num':'OrbNo','orb_spin':'Spin','orb_en':'OrbitalEnergy','orb_occ':'Occupation',
+                'atom_no':'AtomNo','element':'Element','orb_red':'Orb','orbital':'OrbOr','orb_comp':'Cntrb'}
 # end variables
 
+# byte offsets of the last occurrences of all supported sections in the ORCA output
+# only occurrences at or after byte 'start' are considered
+# returns a dict scheme: offset for the sections found
+def find_last_sections(filename, start=0):
+    sections = {}
+    with open(filename,'rb') as f:
+        if ops.fstat(f.fileno()).st_size == 0: # empty files cannot be mapped
+            return sections
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for scheme, look_for_section in look_for_sections.items():
+                pos = mm.rfind(look_for_section.encode(), start)
+                if pos != -1:
+                    sections[scheme] = mm.rfind(b'\n', 0, pos) + 1 # start of the line
+    return sections
+
+# name of the CSV file of a section
+# 'orca.out.csv' for Loewdin, 'orca.out.mulliken.csv' for Mulliken populations
+# with a cache directory (--cache-dir) the CSV file is in the entry of the ORCA output
+def csv_file_name(filename, scheme):
+    prefix = cache_prefixes.get(filename, filename)
+    if scheme == 'loewdin':
+        return prefix+'.csv'
+    return prefix+'.'+scheme+'.csv'
+
+# name of the dataset of a section
+# 'orca.out.dat' for Loewdin, 'orca.out.mulliken.dat' for Mulliken populations
+def dataset_file_name(filename, scheme):
+    return csv_file_name(filename, scheme)[:-len('.csv')]+'.dat'
+
+# fingerprint of the first 'size' bytes of the ORCA output
+# size, first and last fp_chunk bytes - cheap, also for multi-GB files
+def fingerprint(filename, size):
+    fp = hashlib.sha1(str(size).encode())
+    with open(filename,'rb') as f:
+        fp.update(f.read(min(size, fp_chunk)))
+        f.seek(max(size - fp_chunk, 0))
+        fp.update(f.read(min(size, fp_chunk)))
+    return fp.hexdigest()
+
+# read the cache record of the CSV file (None if not available or damaged)
+def read_cache_record(filename):
+    try:
+        with open(filename,'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# write the cache record of the CSV file
+# size        : size of the ORCA output the CSV file is built from
+# fingerprint : fingerprint of these first 'size' bytes
+# section     : byte offset of the section in the ORCA output
+# complete    : False if the section was cut off by the end of the file
+# orbitals    : energy index, orbitals sorted by spin and energy with orb_no, occ
+#               and their rows in the CSV file and the dataset
+# the record is written to a temporary file first, readers never see a partial record
+def write_cache_record(filename, record):
+    temp_name = f'{filename}.{ops.getpid()}.tmp'
+    with open(temp_name,'w') as f:
+        json.dump(record, f, indent=1)
+    ops.replace(temp_name, filename)
+
+# True if the CSV file and the dataset of scheme already hold the complete section at byte 
+# offset 'section' of the ORCA output (cache record valid for the first bytes of the ORCA output)
+def section_cached(filename, scheme, section):
+    record = read_cache_record(csv_file_name(filename, scheme)+'.json')
+    return (record is not None and record.get('version') == cache_version and record['complete'] and
+            record['section'] >= section and ops.path.isfile(dataset_file_name(filename, scheme)) and
+            record['size'] <= ops.path.getsize(filename) and 
+            fingerprint(filename, record['size']) == record['fingerprint'])
+
+# check size limits (cache directory, memory) from argparse
+# e.g. 500MB, 2GB (without unit in MB), returns bytes
+def size_check(string):
+    size = re.fullmatch(r'(\d*\.?\d+)\s*(B|KB|MB|GB|TB)?', string, re.IGNORECASE)
+    if size is None:
+        raise argparse.ArgumentTypeError(f"Malformed size {string}. Quit.")
+    unit = (size.group(2) or 'MB').upper()
+    return int(float(size.group(1)) * 1024 ** ['B','KB','MB','GB','TB'].index(unit))
+
+# size in bytes as string with the largest unit of size_check that keeps the value >= 1
+# e.g. 512.0 KB, 1.5 GB
+def size_str(size):
+    unit = 0
+    while size >= 1024 and unit < 4:
+        size /= 1024
+        unit += 1
+    return f'{size:.1f} ' + ['B','KB','MB','GB','TB'][unit]
+
+# central cache directory (--cache-dir)
+# one entry (sub directory) for each ORCA output with its CSV files, datasets and records 
+# (orca.out.csv, ...), named by the fingerprint of the ORCA output at the time the entry was made
+# index.json of the cache directory keeps for each entry: 
+# source      : path of the ORCA output
+# fingerprint : current fingerprint of the ORCA output
+# size        : bytes of all files of the entry
+# used        : time of the last use (least recently used entries are deleted first)
+def cache_index_name(cache_dir):
+    return ops.path.join(cache_dir, 'index.json')
+
+# exclusive lock of index.json (lock file index.json.lock) for reading, changing and writing the index
+# several runs can use the same cache directory at the same time (no lock without fcntl, e.g. Windows)
+@contextlib.contextmanager
+def cache_lock(cache_dir):
+    with open(cache_index_name(cache_dir)+'.lock','a') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+# lease of an entry: shared lock of <entry>.lock in the cache directory, held by every run that 
+# uses the entry until it ends (released by the system, also after a crash)
+# entries with a lease are not deleted by cache_prune (no leases without fcntl, e.g. Windows)
+def cache_lease_name(cache_dir, entry):
+    return ops.path.join(cache_dir, entry+'.lock')
+
+# True if a run holds a lease of the entry, the caller holds the lock of the index (cache_lock), 
+# so no run can take a lease in the meantime
+def cache_entry_in_use(cache_dir, entry):
+    if fcntl is None or not ops.path.exists(cache_lease_name(cache_dir, entry)):
+        return False
+    with open(cache_lease_name(cache_dir, entry),'a') as lease:
+        try:
+            fcntl.flock(lease, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(lease, fcntl.LOCK_UN)
+    return False
+
+# entry of the ORCA output in the cache directory: same fingerprint (also copied or moved 
+# ORCA outputs) or same path (grown or changed ORCA output, the cache record decides)
+# a new entry is made (and added to the index) if create is True
+# entries whose directory was deleted (not by cache_prune) are dropped from the index first
+# the time of the last use of the entry is updated and the run takes a lease of the entry,
+# both under the lock of the index, so runs that prune the cache directory do not delete it
+# sets the prefix of the cache files of the ORCA output, returns the entry (or None)
+def cache_entry(cache_dir, filename, create=True):
+    filename_fingerprint = fingerprint(filename, ops.path.getsize(filename))
+    source = ops.path.abspath(filename)
+    with cache_lock(cache_dir):
+        index = {entry: item for entry, item in (read_cache_record(cache_index_name(cache_dir)) or {}).items() 
+                 if ops.path.isdir(ops.path.join(cache_dir, entry))}
+        entry = next((entry for entry, item in index.items() if item['fingerprint'] == filename_fingerprint), 
+                     next((entry for entry, item in index.items() if item['source'] == source), None))
+        if entry is None and create:
+            entry = filename_fingerprint
+            ops.makedirs(ops.path.join(cache_dir, entry), exist_ok=True)
+            index[entry] = dict(source=source, fingerprint=filename_fingerprint, size=0)
+        if entry is not None:
+            index[entry]['used'] = time.time()
+            write_cache_record(cache_index_name(cache_dir), index)
+            if fcntl is not None and entry not in cache_leases:
+                cache_leases[entry] = open(cache_lease_name(cache_dir, entry),'a') # open until the run ends
+                fcntl.flock(cache_leases[entry], fcntl.LOCK_SH)
+    if entry is not None:
+        cache_prefixes[filename] = ops.path.join(cache_dir, entry, 'orca.out')
+    return entry
+
+# bytes of all files of an entry
+def cache_entry_size(cache_dir, entry):
+    path = ops.path.join(cache_dir, entry)
+    return sum(ops.path.getsize(ops.path.join(path, name)) for name in ops.listdir(path))
+
+# update the entries (entry: ORCA output) in the index after use, 
+# then delete least recently used entries until the size limit is met
+def cache_update(cache_dir, entries, limit):
+    with cache_lock(cache_dir):
+        index = read_cache_record(cache_index_name(cache_dir)) or {}
+        for entry, filename in entries.items():
+            index[entry] = dict(source=ops.path.abspath(filename), 
+                                fingerprint=fingerprint(filename, ops.path.getsize(filename)),
+                                size=cache_entry_size(cache_dir, entry), used=time.time())
+        cache_prune(cache_dir, index, limit, keep=entries)
+
+# delete least recently used entries (not the ones in keep or in use by other runs, see cache_entry_in_use) 
+# until all entries fit into limit bytes
+# entries of deleted directories are removed from the index, directories missing in the index 
+# are added (time of the last use: modification time of the directory)
+# the caller holds the lock of the index (cache_lock), returns the deleted entries
+def cache_prune(cache_dir, index, limit, keep=()):
+    index = {entry: item for entry, item in index.items() if ops.path.isdir(ops.path.join(cache_dir, entry))}
+    for entry in ops.listdir(cache_dir):
+        path = ops.path.join(cache_dir, entry)
+        if entry not in index and ops.path.isdir(path):
+            index[entry] = dict(source='(unknown)', fingerprint=entry, 
+                                size=cache_entry_size(cache_dir, entry), used=ops.path.getmtime(path))
+    total = sum(item['size'] for item in index.values())
+    deleted = []
+    for entry in sorted(index, key=lambda entry: index[entry]['used']):
+        if total <= limit:
+            break
+        if entry not in keep and not cache_entry_in_use(cache_dir, entry):
+            shutil.rmtree(ops.path.join(cache_dir, entry), ignore_errors=True)
+            if ops.path.exists(cache_lease_name(cache_dir, entry)):
+                ops.remove(cache_lease_name(cache_dir, entry))
+            total -= index[entry]['size']
+            deleted.append(index.pop(entry))
+    write_cache_record(cache_index_name(cache_dir), index)
+    return deleted
+
+# print entries (least recently used first) and size of the cache directory
+def print_cache_stats(cache_dir, index, limit):
+    print(f'Cache directory           : {ops.path.abspath(cache_dir)}')
+    print(f'Entries                   : {len(index)}')
+    print(f'Size (MB)                 : {sum(item["size"] for item in index.values())/2**20:.1f} '
+          f'of {limit/2**20:.1f}')
+    for entry in sorted(index, key=lambda entry: index[entry]['used']):
+        item = index[entry]
+        print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(item["used"]))} '
+              f'{item["size"]/2**20:10.1f} MB  {item["source"]}')
+
+# byte ranges of the orbital blocks of the section starting at byte 'offset'
+# blocks are separated by empty lines, 2 empty lines = end of the section
+# lines with '--', 'SPIN' or 'THRESHOLD' do not belong to a block
+# returns a list of (start, end, spin) and
+# True if the end of the section has been reached (False if the file ends before)
+def locate_blocks(filename, offset):
+    blocks = []          # (start, end, spin) of every block
+    emptyline_count = 0  # empty line count
+    spin = 0             # 1 for beta orbitals
+    complete = False     # end of the section detected
+
+    with open(filename,'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = mm.find(b'\n', offset) + 1 # skip the line with the name of the section
+            if pos == 0:
+                return blocks, complete
+
+            for emptyl in emptyline.finditer(mm, pos):
+                if mm[emptyl.end():emptyl.end() + 1] != b'\n': # end of file (partial last line), not an empty line
+                    break
+
+                # skip lines without orbitals at the beginning of the chunk
+                block_start = pos
+                while block_start < emptyl.start():
+                    eol = mm.find(b'\n', block_start, emptyl.start()) + 1 or emptyl.start()
+                    line = mm[block_start:eol]
+                    if b"SPIN DOWN" in line: # check for beta orbitals
+                        spin=1               # set to 1 if found
+                    if not b"--" in line and not b"SPIN" in line and not b"THRESHOLD" in line:
+                        break
+                    block_start = eol
+
+                if block_start < emptyl.start():
+                    blocks.append((block_start, emptyl.start(), spin)) # 1 empty line = end of the small orbital block
+                    emptyline_count = 1
+                else:
+                    emptyline_count +=1
+                    if emptyline_count == 2: # 2 empty lines = end of the whole orbital block
+                        complete = True
+                        break
+
+                pos = emptyl.end() + 1
+
+    return blocks, complete
+
+# metadata of the section for instant info queries (--info)
+# HOMO/LUMO and number of orbitals for each spin, elements, atoms and energy range
+# homo is the orbital no. of the HOMO as used in the analysis
+# oall is any table with the columns atom_no and element (e.g. oall)
+def orbital_info(orbitals, oall):
+    homo = orbitals.loc[orbitals.orb_occ > 0, 'orb_num'].max() # NaN without occupied orbitals
+    info = dict(homo=None if pd.isna(homo) else int(homo), orbitals={})
+    for orb_spin, orbs in orbitals.groupby('orb_spin'):
+        occ = orbs[(orbs.orb_occ > 0)]
+        virt = orbs[(orbs.orb_occ == 0)]
+        info['orbitals']['alpha' if orb_spin == 0 else 'beta'] = dict(
+            count=len(orbs), first=int(orbs.orb_num.min()), last=int(orbs.orb_num.max()),
+            homo=int(occ.orb_num.max()) if len(occ) else None,
+            e_homo=float(occ.orb_en.max()) if len(occ) else None,
+            lumo=int(virt.orb_num.min()) if len(virt) else None,
+            e_lumo=float(virt.orb_en.min()) if len(virt) else None)
+    atoms = oall[['atom_no','element']].drop_duplicates().sort_values('atom_no')
+    info['elements'] = sorted(atoms.element.unique().tolist())
+    info['atoms'] = [[int(atom_no), element] for atom_no, element in zip(atoms.atom_no, atoms.element)]
+    info['energy_range'] = [float(orbitals.orb_en.min()), float(orbitals.orb_en.max())]
+    return info
+
+# print the metadata of the section (--info)
+def print_info(info):
+    print('==================================================================')
+    print(' '.join((look_for_sections[info['scheme']],'in',info['source'])))
+    for spin_str, orbs in info['orbitals'].items():
+        print(f"Orbitals ({spin_str})".ljust(26) + f": {orbs['count']} ({orbs['first']}...{orbs['last']})")
+        for name in ('homo','lumo'):
+            if orbs[name] is not None:
+                print(f"{name.upper()} ({spin_str})".ljust(26) + f": {orbs[name]} ({orbs['e_'+name]:.5f} Eh)")
+    print("Orbital no. of the HOMO   : " + str(info['homo']))
+    print("Orbital energies (Eh)     : " + '{:.5f}...{:.5f}'.format(*info['energy_range']))
+    print("Elements                  : " + ' '.join(info['elements']))
+    print("Atoms                     : " + ', '.join(f'{atom_no} {element}' for atom_no, element in info['atoms']))
+    print('==================================================================')
+
+# read orbital blocks given by (start, end, spin) byte ranges in rows
+# every block has 3 lines (orb_no, energy, occ) followed by lines with 
+# atom_no, element, orbital, contribution to each orbital of the block
+# the rows keep the order of the ORCA output: block by block, orbital by orbital
+# per row only atom_no, the code of the label (element, orbital) and the contribution are kept
+# (numbers only, cheap to send from a worker process), the orbital columns follow from the orbitals
+# returns the rows (arrays), the labels (in the order of the codes) and a list of orbitals 
+# with spin, orb_no, energy, occ and number of lines
+def read_blocks(filename, blocks):
+    rows = {col: [] for col in ('atom_no','label','orb_comp')}
+    labels = {} # (element, orbital): code
+    orbitals = []
+
+    with open(filename,'rb') as orca_out:
+        for start, end, spin in blocks:
+            orca_out.seek(start)
+            rawblock = [line.split() for line in orca_out.read(end - start).decode('latin-1').splitlines()
+                        if not "--" in line and not "SPIN" in line and not "THRESHOLD" in line]
+            raworbitals = rawblock[3:]
+            n_orb = len(rawblock[0]) # number of orbitals in the block
+            n_ao = len(raworbitals)  # number of AOs (lines) in the block
+
+            # contributions: one line per AO, one column per orbital
+            cntrb = np.array([ao[3:] for ao in raworbitals], dtype='float64').reshape(n_ao, n_orb)
+            rows['orb_comp'].append(cntrb.T.ravel())
+            rows['atom_no'].append(np.tile(np.array([ao[0] for ao in raworbitals], dtype='int32'), n_orb))
+            rows['label'].append(np.tile(np.array([labels.setdefault((ao[1], ao[2]), len(labels)) 
+                                                   for ao in raworbitals], dtype='int32'), n_orb))
+            orbitals.extend((spin, int(orb_num), float(orb_en), float(np.float32(orb_occ)), n_ao) 
+                            for orb_num, orb_en, orb_occ in zip(*rawblock[0:3]))
+
+    rows = {col: np.concatenate(arrs) if arrs else np.zeros(0, dtype='float64' if col == 'orb_comp' else 'int32')
+            for col, arrs in rows.items()}
+    return rows, list(labels), orbitals
+
+# table oall from the parts (rows, labels, orbitals) of read_blocks in the order of the ORCA output
+# and the table of orbitals of all parts (orbital_table)
+# the label codes of each part are mapped to common codes, element, orb_red and orbital are 
+# categorical (codes per row, the strings are only made once per label), the orbital columns 
+# are repeated per row
+def oall_table(parts, orbitals):
+    labels = {}
+    codes = np.concatenate([np.array([labels.setdefault(label, len(labels)) for label in part_labels], 
+                                     dtype='int64')[part_rows['label']] for part_rows, part_labels, _ in parts])
+    n_rows = (orbitals.row_end - orbitals.row_start).values
+    oall = dict(
+        orb_num=np.repeat(orbitals.orb_num.values, n_rows).astype('int64'),
+        orb_spin=np.repeat(orbitals.orb_spin.values, n_rows).astype('int64'),
+        orb_en=np.repeat(orbitals.orb_en.values, n_rows).astype('float64'),
+        orb_occ=np.repeat(orbitals.orb_occ.values, n_rows).astype('float32'),
+        atom_no=np.concatenate([part[0]['atom_no'] for part in parts]).astype('int64'))
+    # code of each label in the categories of element, orb_red and orbital
+    for col, values in (('element', [element for element, _ in labels]),
+                        ('orb_red', [orbital[0] for _, orbital in labels]),
+                        ('orbital', [orbital for _, orbital in labels])):
+        label_codes, categories = pd.factorize(np.array(values, dtype=object))
+        oall[col] = pd.Categorical.from_codes(label_codes[codes], categories)
+    oall['orb_comp'] = np.concatenate([part[0]['orb_comp'] for part in parts])
+    return pd.DataFrame(oall, copy=False) # no consolidation of the columns
+
+# read orbitals of the given blocks in table oall
+# the blocks are read by 'jobs' processes, the result does not depend on 'jobs'
+# returns oall and the table of orbitals (orb_spin, orb_num, orb_en, orb_occ, 
+# first and last+1 row of the orbital in oall)
+def read_orbitals(filename, blocks, jobs=1):
+    if jobs > 1 and len(blocks) > 1:
+        # chunks of similar size in bytes, more chunks than processes for a balanced load
+        n_chunks = min(len(blocks), 4 * jobs)
+        chunks = split_blocks(blocks, (blocks[-1][1] - blocks[0][0]) / n_chunks)
+        # fork: the workers must not run this script again
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=mp.get_context('fork')) as pool:
+            parts = list(pool.map(read_blocks, [filename] * len(chunks), chunks)) # map keeps the order
+    else:
+        parts = [read_blocks(filename, blocks)]
+
+    orbitals = orbital_table([orbital for part in parts for orbital in part[2]])
+    oall = oall_table(parts, orbitals)
+
+    return oall, orbitals
+
+# write table as CSV file, with jobs > 1 slices of the table are formatted by 'jobs' processes 
+# (forked, they share the table) and written in order, the file does not depend on 'jobs'
+csv_table = None # table of write_csv for the workers
+
+# CSV text of the rows first...last-1 of csv_table, header with the first row
+def csv_rows(first, last):
+    return csv_table.iloc[first:last].to_csv(header=first == 0)
+
+def write_csv(filename, table, jobs=1):
+    global csv_table
+    if jobs > 1 and len(table) > 1:
+        csv_table = table
+        bounds = np.linspace(0, len(table), min(len(table), 4 * jobs) + 1).astype('int64')
+        with ProcessPoolExecutor(max_workers=jobs, mp_context=mp.get_context('fork')) as pool:
+            with open(filename,'w') as f:
+                for text in pool.map(csv_rows, bounds[:-1], bounds[1:]): # map keeps the order
+                    f.write(text)
+        csv_table = None
+    else:
+        table.to_csv(filename)
+
+# split the blocks (start, end, spin) in chunks of about chunk_size bytes (at least one block each)
+def split_blocks(blocks, chunk_size):
+    chunks = [[]]
+    for block in blocks:
+        if chunks[-1] and block[0] - chunks[-1][0][0] >= chunk_size:
+            chunks.append([])
+        chunks[-1].append(block)
+    return chunks
+
+# table of orbitals from the list of orbitals of read_blocks (spin, orb_no, energy, occ, number of lines)
+# with the first and last+1 row of each orbital
+def orbital_table(orbitals):
+    orbitals = pd.DataFrame(orbitals, columns=['orb_spin','orb_num','orb_en','orb_occ','n_rows'])
+    orbitals['row_end'] = orbitals.n_rows.cumsum()
+    orbitals['row_start'] = orbitals.row_end - orbitals.n_rows
+    return orbitals[['orb_spin','orb_num','orb_en','orb_occ','row_start','row_end']]
+
+# read orbitals of the given blocks chunk by chunk (about chunk_size bytes of the ORCA output each)
+# every chunk is appended to the CSV file csv_name and only kept as codes for the dataset,
+# the table oall is never held in memory as a whole
+# returns the table of orbitals (like read_orbitals), the rows and the categories for write_dataset_rows
+def read_orbitals_chunked(filename, blocks, chunk_size, csv_name):
+    rows = {col: [] for col in ('atom_no','orb_comp','element','orbital','orb_red')}
+    categories = {col: {} for col in ('element','orbital','orb_red')} # value: code
+    orbitals = []
+    n_rows = 0
+    for chunk in split_blocks(blocks, chunk_size):
+        chunk_part = read_blocks(filename, chunk)
+        part = oall_table([chunk_part], orbital_table(chunk_part[2]))
+        chunk_orbitals = chunk_part[2]
+        part.index += n_rows
+        part.to_csv(csv_name, mode='a' if n_rows else 'w', header=not n_rows)
+        n_rows += len(part)
+        rows['atom_no'].append(part.atom_no.values.astype('<i4'))
+        rows['orb_comp'].append(part.orb_comp.values.astype('<f8'))
+        # codes of the chunk (categorical) mapped to codes in the order of first appearance in the section
+        for col, codes_of in categories.items():
+            rows[col].append(np.array([codes_of.setdefault(value, len(codes_of)) 
+                                       for value in part[col].cat.categories], dtype='<i2')[part[col].cat.codes.values])
+        orbitals.extend(chunk_orbitals)
+    rows = {col: np.concatenate(arrs) for col, arrs in rows.items()}
+    return orbital_table(orbitals), rows, {col: list(codes_of) for col, codes_of in categories.items()}
+
+# estimated number of rows of a section: rows per byte of the first block x bytes of all blocks
+# (at least one block)
+def estimate_rows(filename, blocks):
+    _, _, orbitals = read_blocks(filename, blocks[:1])
+    block_rows = sum(orbital[4] for orbital in orbitals)
+    return int(block_rows * (blocks[-1][1] - blocks[0][0]) / (blocks[0][1] - blocks[0][0]))
+
+# how to read a section: 'memory' (one process), 'parallel' (several processes) or 'chunked'
+# (read_orbitals_chunked) from the estimated rows of the section and the memory limit (bytes)
+# without memory limit the section is read in memory (with 'jobs' processes if jobs > 1)
+# with memory limit: in parallel if the section is large and fits in memory (-j processes or
+# all CPUs), in memory if it fits, otherwise in chunks as large as the memory limit allows
+# returns the engine, the number of processes, the chunk size (bytes of the ORCA output) 
+# and the estimated rows and memory (bytes) of the section in memory
+def select_engine(filename, blocks, memory_limit, jobs):
+    section_bytes = blocks[-1][1] - blocks[0][0]
+    rows = estimate_rows(filename, blocks)
+    memory = rows * memory_row_bytes
+    if memory_limit is None:
+        return ('parallel' if jobs > 1 else 'memory'), jobs, None, rows, memory
+    if jobs == 1 and 'fork' in mp.get_all_start_methods():
+        jobs = ops.cpu_count() or 1
+    if (jobs > 1 and len(blocks) > 1 and section_bytes >= parallel_min_bytes and 
+        memory * parallel_memory_factor <= memory_limit):
+        return 'parallel', jobs, None, rows, memory
+    if memory <= memory_limit:
+        return 'memory', 1, None, rows, memory
+    chunk_rows = max((memory_limit - rows * chunked_row_bytes) // memory_row_bytes, 1)
+    return 'chunked', 1, chunk_rows * section_bytes / max(rows, 1), rows, memory
+
+# energy index: orbitals sorted by spin and energy (for binary search)
+def energy_index(orbitals):
+    return orbitals.sort_values(['orb_spin','orb_en'], kind='mergesort', ignore_index=True)
+
+# orbitals with energies from e_low to e_high (in Eh) from the energy index
+# binary search for each spin
+def select_energy_window(orbitals, e_low, e_high):
+    selected = []
+    for orb_spin, orbs in orbitals.groupby('orb_spin'):
+        first = np.searchsorted(orbs['orb_en'].values, e_low, side='left')
+        last = np.searchsorted(orbs['orb_en'].values, e_high, side='right')
+        selected.append(orbs.iloc[first:last])
+    return pd.concat(selected)
+
+# write the dataset as Arrow IPC stream to sink (file name or binary file object)
+# one record batch per export_batch_rows rows (whole orbitals), the batches are built 
+# from the mapped dataset one at a time; element, orb_red and orbital are dictionary 
+# encoded with the categories of the dataset; the info record is kept in the schema 
+# metadata (key 'orca_orb'); returns the number of rows and batches
+# (a new dataset is built before, with the whole table in memory unless it is read in chunks)
+def export_arrow(dataset, info, sink):
+    import pyarrow as pa # optional, only needed for the export
+    orbital_row = dataset['orbital_row']
+    categories = {col: pa.array(dataset['categories'][col], type=pa.string()) 
+                  for col in ('element','orb_red','orbital')}
+    schema = pa.schema([('orb_num', pa.int32()), ('orb_spin', pa.int8()), ('orb_en', pa.float64()),
+                        ('orb_occ', pa.float32()), ('atom_no', pa.int32())] + 
+                       [(col, pa.dictionary(pa.int16(), pa.string())) for col in categories] + 
+                       [('orb_comp', pa.float64())],
+                       metadata={'orca_orb': json.dumps(info)})
+    # first orbital of each batch
+    bounds = np.unique(np.append(np.searchsorted(orbital_row[:-1], 
+                       np.arange(0, orbital_row[-1], export_batch_rows), side='right') - 1, 
+                       len(orbital_row) - 1).clip(0))
+    n_batches = 0
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for orb_first, orb_last in zip(bounds[:-1], bounds[1:]):
+            first, last = orbital_row[orb_first], orbital_row[orb_last]
+            n_rows = np.diff(orbital_row[orb_first:orb_last + 1])
+            columns = [pa.array(np.repeat(dataset[name][orb_first:orb_last], n_rows)) 
+                       for name in ('orbital_num','orbital_spin','orbital_en','orbital_occ')]
+            columns.append(pa.array(dataset['atom_no'][first:last]))
+            columns += [pa.DictionaryArray.from_arrays(pa.array(dataset[col][first:last]), values)
+                        for col, values in categories.items()]
+            columns.append(pa.array(dataset['orb_comp'][first:last]))
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            n_batches += 1
+    return int(orbital_row[-1]), n_batches
+
+# memory (bytes) of the table of the rows of orbitals (row_start, row_end), estimated like for reading
+def table_memory(orbitals):
+    return int((orbitals.row_end - orbitals.row_start).sum()) * memory_row_bytes
+
+# merge the rows of orbitals (row_start, row_end) to contiguous ranges
+def row_ranges(orbitals):
+    ranges = []
+    for first, last in sorted(zip(orbitals.row_start, orbitals.row_end)):
+        if ranges and ranges[-1][1] == first:
+            ranges[-1][1] = last
+        else:
+            ranges.append([first, last])
+    return ranges
+
+# codes (0, 1, ...) of the values in column 'by' or of the combinations of values in a list of columns
+# of table, sorted by value; factorizes each column and combines the codes (faster than sorting strings)
+# returns the codes (one per row) and the values (Index or MultiIndex)
+def factorize_columns(table, by):
+    if isinstance(by, str):
+        codes, values = pd.factorize(table[by].values, sort=True)
+        return codes, pd.Index(values, name=by)
+    codes, levels = 0, []
+    for col in by:
+        col_codes, col_values = pd.factorize(table[col].values, sort=True)
+        codes = codes * len(col_values) + col_codes
+        levels.append(col_values)
+    codes, combined = pd.factorize(codes, sort=True)
+    level_codes = []
+    for col_values in reversed(levels):
+        level_codes.insert(0, combined % len(col_values))
+        combined = combined // len(col_values)
+    return codes, pd.MultiIndex(levels=levels, codes=level_codes, names=by)
+
+# contributions summed over the values in column 'by' (e.g. AtomNo) or in a list of columns 
+# (e.g. [AtomNo, Orb]) for each orbital of table (renamed columns, one spin) as a matrix: 
+# one row per orbital, one column per value
+# rows are indexed by (OrbNo, OrbitalEnergy, Occupation), like the summary tables
+def contribution_matrix(table, by):
+    orb_nums, first, rows = np.unique(table.OrbNo.values, return_index=True, return_inverse=True)
+    cols, values = factorize_columns(table, by)
+    matrix = np.bincount(rows * len(values) + cols, weights=table.Cntrb.values, 
+                         minlength=len(orb_nums) * len(values)).reshape(len(orb_nums), len(values))
+    index = pd.MultiIndex.from_arrays([orb_nums, table.OrbitalEnergy.values[first], 
+                                       table.Occupation.values[first]],
+                                      names=['OrbNo','OrbitalEnergy','Occupation'])
+    return pd.DataFrame(matrix, index=index, columns=values)
+
+# mapping matrix (atoms x fragments) with 1 if the atom belongs to the fragment
+# atoms and elements are arrays (element of each atom), fragments is from fragments_check
+# atoms in no fragment are collected in the fragment 'Rest'
+# returns the matrix and the names of the fragments
+def fragment_matrix(fragments, atoms, elements):
+    names = [name for name, _ in fragments]
+    matrix = np.zeros((len(atoms), len(fragments)))
+    for col, (name, members) in enumerate(fragments):
+        for member in members:
+            if member[0].isdigit():
+                first, _, last = member.partition('-')
+                matrix[:, col] += (atoms >= int(first)) & (atoms <= int(last or first))
+            else:
+                matrix[:, col] += (elements == member)
+    matrix = np.minimum(matrix, 1)
+    if (matrix.sum(axis=1) > 1).any():
+        print('Warning! Some atoms belong to more than one fragment.\n')
+    rest = matrix.sum(axis=1) == 0
+    if rest.any():
+        matrix = np.column_stack((matrix, rest))
+        names.append('Rest')
+    return matrix, names
+
+# the k largest contributions of the values in the columns 'by' (e.g. Element, AtomNo) 
+# to each orbital of table (renamed columns, one spin) and the leftover (Rest) of each orbital
+# only rows in selected (bool array) are ranked, all rows count for the leftover
+# contributions < threshold are not listed (but count for the leftover)
+# orbitals are processed in chunks, a partial selection (argpartition) picks the k largest
+# returns a table indexed by (OrbNo, OrbitalEnergy, Occupation, Rank) with at most k+1 rows per orbital
+def top_contributions(table, by, k, selected, threshold=0):
+    orb_nums, first, rows = np.unique(table.OrbNo.values, return_index=True, return_inverse=True)
+    cols, labels = factorize_columns(table, by)
+    cntrb = table.Cntrb.values
+    totals = np.bincount(rows, weights=cntrb, minlength=len(orb_nums))
+    k = min(k, len(labels))
+    top_cols = np.zeros((len(orb_nums), k), dtype=int)
+    top_vals = np.zeros((len(orb_nums), k))
+    chunk = max(1, top_chunk // max(1, len(labels)))
+    for start in range(0, len(orb_nums), chunk):
+        stop = min(start + chunk, len(orb_nums))
+        in_chunk = selected & (rows >= start) & (rows < stop)
+        matrix = np.bincount((rows[in_chunk] - start) * len(labels) + cols[in_chunk], 
+                             weights=cntrb[in_chunk], 
+                             minlength=(stop - start) * len(labels)).reshape(stop - start, len(labels))
+        part = np.argpartition(-matrix, k - 1, axis=1)[:, :k]
+        vals = np.take_along_axis(matrix, part, axis=1)
+        order = np.argsort(-vals, axis=1, kind='stable')
+        top_cols[start:stop] = np.take_along_axis(part, order, axis=1)
+        top_vals[start:stop] = np.take_along_axis(vals, order, axis=1)
+    # k contributions and the leftover for each orbital, then drop empty entries
+    # contributions that are not listed (< threshold) count for the leftover
+    listed = np.column_stack(((top_vals > 0) & (top_vals >= threshold), np.ones(len(orb_nums), bool)))
+    vals = np.column_stack((top_vals, totals - np.where(listed[:, :-1], top_vals, 0).sum(axis=1))).round(1) + 0.0 # no -0.0
+    orb = np.repeat(np.arange(len(orb_nums)), k + 1).reshape(-1, k + 1)[listed]
+    col = np.column_stack((top_cols, np.full(len(orb_nums), len(labels))))[listed]
+    top = {'OrbNo': orb_nums[orb], 'OrbitalEnergy': table.OrbitalEnergy.values[first][orb],
+           'Occupation': table.Occupation.values[first][orb],
+           'Rank': np.array(list(range(1, k + 1)) + ['Rest'], dtype=object)[np.nonzero(listed)[1]]}
+    for level, name in enumerate(by):
+        top[name] = np.append(labels.get_level_values(level).values.astype(object), '')[col]
+    top['Cntrb'] = vals[listed]
+    return pd.DataFrame(top).set_index(['OrbNo','OrbitalEnergy','Occupation','Rank'])
+
+# threshold sweep (--threshold-sweep) of the summaries of atom, red. AO and AO contributions
+# table: renamed columns, orbitals in the range, constraints applied
+# the contributions of each level are summed up for each orbital with the groupby of the summaries 
+# (same sums, also for contributions on a threshold) and sorted once, entries and contribution 
+# >= each threshold follow from binary search and cumulative sums
+# the size of o-analysis.txt is estimated from the number of entries and the bytes per line of
+# each summary (rendered for the first and last orbital), AOs are also listed per AO
+# returns one row per threshold: entries and their contribution (% of all) per level, size in kB
+def threshold_sweep(table, thresholds):
+    index = ['OrbNo','OrbitalEnergy','Occupation']
+    sample = table[table.OrbNo.isin([table.OrbNo.min(), table.OrbNo.max()])]
+    n_spins = table.Spin.nunique()
+    n_orbitals = len(table.drop_duplicates(['Spin','OrbNo']))
+    
+    # header and element tables (no threshold)
+    lines = sample.groupby(index + ['Element']).agg({'Cntrb':'sum'}).unstack().to_string().splitlines()[3:]
+    size = 1024 + n_orbitals * np.mean([len(line) + 1 for line in lines])
+    
+    sweep = pd.DataFrame(index=pd.Index(thresholds, name='Threshold (%)'))
+    size = np.full(len(thresholds), size)
+    for level, by in (('Atoms', ['Element','AtomNo']),
+                      ('Shells', ['Element','AtomNo','Orb']),
+                      ('AOs', ['Element','AtomNo','Orb','OrbOr'])):
+        cntrb = np.sort(table.groupby(['Spin'] + index + by).Cntrb.sum().values)
+        entries = len(cntrb) - np.searchsorted(cntrb, thresholds, side='left')
+        largest = np.append(0, np.cumsum(cntrb[::-1])) # sum of the n largest contributions
+        sweep[level] = entries
+        sweep[level+' (%)'] = largest[entries] / (largest[-1] or 1) * 100
+        
+        # title, rule and column names of each summary, one line per entry
+        summaries = [sample.groupby(index + by).agg({'Cntrb':'sum'})]
+        if level == 'AOs':
+            summaries.append(summaries[0].reset_index().drop(columns=['OrbitalEnergy']).rename(
+                             {'Occupation':'Occ'},axis='columns').set_index([
+                             'AtomNo','Element','Orb','OrbOr','OrbNo','Occ']).sort_index())
+        for summary in summaries:
+            lines = summary.to_string().splitlines()[2:]
+            size = size + n_spins * 200 + entries * np.mean([len(line) + 1 for line in lines])
+    sweep['Size (kB)'] = size / 1024
+    return sweep
+
+# localization of the orbitals of table (renamed columns, one spin) from the atom contributions
+# p: share of each atom in an orbital (atom contribution / sum of the orbital)
+# IPR             : inverse participation ratio sum(p^2), 1 for one atom, 1/N for N equal atoms
+# Entropy         : Shannon entropy -sum(p ln p), 0 for one atom, ln N for N equal atoms
+# IPR (fragments) : IPR of the fragment shares (fragments from fragments_check, optional)
+# Element         : element with the largest share in the orbital and its share (%)
+# all values are reductions (bincount) over the (orbital, atom) pairs, there is no 
+# orbitals x atoms matrix; rows are indexed by (OrbNo, OrbitalEnergy, Occupation)
+def localization(table, fragments=None):
+    codes, pairs = factorize_columns(table, ['OrbNo','AtomNo'])
+    cntrb = np.bincount(codes, weights=table.Cntrb.values)
+    orb, atom = (level_codes.astype('int64') for level_codes in pairs.codes)
+    orb_nums, atoms = pairs.levels
+    total = np.bincount(orb, weights=cntrb, minlength=len(orb_nums))
+    p = cntrb / np.where(total != 0, total, 1)[orb]
+    
+    _, first = np.unique(table.OrbNo.values, return_index=True)
+    loc = pd.DataFrame(index=pd.MultiIndex.from_arrays([orb_nums, table.OrbitalEnergy.values[first],
+                                                        table.Occupation.values[first]],
+                                                       names=['OrbNo','OrbitalEnergy','Occupation']))
+    loc['IPR'] = np.bincount(orb, weights=p**2, minlength=len(orb_nums))
+    loc['Entropy'] = -np.bincount(orb, weights=np.where(p > 0, p * np.log(np.where(p > 0, p, 1)), 0), 
+                                  minlength=len(orb_nums))
+    
+    # element (and fragments) of each atom
+    elements = table.drop_duplicates('AtomNo').set_index('AtomNo').Element.reindex(atoms).values
+    if fragments is not None:
+        fr_matrix, _ = fragment_matrix(fragments, atoms, elements)
+        fr_shares = np.column_stack([np.bincount(orb, weights=p * fr_matrix[atom, col], minlength=len(orb_nums))
+                                     for col in range(fr_matrix.shape[1])])
+        fr_shares = fr_shares / np.where(fr_shares.sum(axis=1) != 0, fr_shares.sum(axis=1), 1)[:, None]
+        loc['IPR (fragments)'] = (fr_shares**2).sum(axis=1)
+        
+    el_codes, el_names = pd.factorize(elements, sort=True)
+    el_shares = np.bincount(orb * len(el_names) + el_codes[atom], weights=p, 
+                            minlength=len(orb_nums) * len(el_names)).reshape(len(orb_nums), len(el_names))
+    dominant = el_shares.argmax(axis=1)
+    loc['Element'] = np.asarray(el_names, dtype=object)[dominant]
+    loc['Share (%)'] = el_shares[np.arange(len(orb_nums)), dominant] * 100
+    return loc
+
+# projected density of states on the (uniform) energy grid
+# energies (orbitals) and weights (orbitals x projections) are broadened with 
+# Gaussian or Lorentzian functions of the FWHM fwhm (same unit as the energies)
+# the weights are distributed linearly to the two nearest grid points (padded by pdos_pad FWHM), 
+# then all projections are convolved with the broadening function at once (FFT)
+# the round-off of the FFT (small negative densities) is clipped to 0
+# returns the PDOS (grid points x projections)
+def pdos(energies, weights, grid, shape, fwhm):
+    step = grid[1] - grid[0]
+    pad = int(np.ceil(pdos_pad[shape] * fwhm / step))
+    points = len(grid) + 2 * pad
+    position = (energies - grid[0]) / step + pad
+    lower = np.floor(position).astype(int)
+    upper = position - lower
+    inside = (lower >= 0) & (lower < points - 1)
+    lower, upper, weights = lower[inside], upper[inside, None], weights[inside]
+    cols = np.arange(weights.shape[1])
+    binned = (np.bincount((lower[:, None] * len(cols) + cols).ravel(), 
+                          weights=(weights * (1 - upper)).ravel(), minlength=points * len(cols)) + 
+              np.bincount(((lower[:, None] + 1) * len(cols) + cols).ravel(), 
+                          weights=(weights * upper).ravel(), minlength=points * len(cols)))
+    binned = binned.reshape(points, len(cols))
+    # broadening function from -pad to pad grid steps
+    x = np.arange(-pad, pad + 1) * step
+    if shape == 'lorentz':
+        kernel = fwhm / (2 * np.pi) / (x ** 2 + (fwhm / 2) ** 2)
+    else:
+        kernel = np.sqrt(4 * np.log(2) / np.pi) / fwhm * np.exp(-4 * np.log(2) * x ** 2 / fwhm ** 2)
+    n = 1 << int(np.ceil(np.log2(points + 2 * pad)))
+    result = np.fft.irfft(np.fft.rfft(binned, n, axis=0) * np.fft.rfft(kernel, n)[:, None], n, axis=0)
+    return np.maximum(result[2 * pad:2 * pad + len(grid)], 0)
+
+# align orbitals b to orbitals a (orbital numbers and energies, orbital numbers sorted)
+# align 'index': orbital of b with the same number (orbitals of a without one are dropped), 
+# 'energy': orbital of b with the nearest energy
+# returns the rows of a and the aligned rows of b
+def align_orbitals(orb_a, en_a, orb_b, en_b, align):
+    if align == 'energy':
+        rows_a = np.arange(len(orb_a))
+        order = np.argsort(en_b, kind='stable')
+        upper = np.searchsorted(en_b[order], en_a).clip(0, len(en_b) - 1)
+        lower = (upper - 1).clip(0)
+        nearer = np.where(np.abs(en_a - en_b[order][lower]) <= np.abs(en_a - en_b[order][upper]), lower, upper)
+        return rows_a, order[nearer]
+    rows_a = np.nonzero(np.isin(orb_a, orb_b))[0]
+    return rows_a, np.searchsorted(orb_b, orb_a[rows_a])
+
+# differences of the contributions (summed over 'by', see contribution_matrix) of aligned orbitals
+# of table_a and table_b (renamed columns, one spin each), see align_orbitals for align
+# returns a table indexed by (OrbNo, OrbitalEnergy, OrbNo(B), OrbitalEnergy(B)) with one column 
+# per value of 'by' in table_a or table_b
+def compare_contributions(table_a, table_b, by, align):
+    cntrb_a = contribution_matrix(table_a, by)
+    cntrb_b = contribution_matrix(table_b, by)
+    columns = cntrb_a.columns.union(cntrb_b.columns).set_names(cntrb_a.columns.names)
+    orb_a, orb_b = (cntrb.index.get_level_values('OrbNo').values for cntrb in (cntrb_a, cntrb_b))
+    en_a, en_b = (cntrb.index.get_level_values('OrbitalEnergy').values for cntrb in (cntrb_a, cntrb_b))
+    rows_a, rows_b = align_orbitals(orb_a, en_a, orb_b, en_b, align)
+    diff = (cntrb_a.reindex(columns=columns, fill_value=0).values[rows_a] - 
+            cntrb_b.reindex(columns=columns, fill_value=0).values[rows_b])
+    index = pd.MultiIndex.from_arrays([orb_a[rows_a], en_a[rows_a], orb_b[rows_b], en_b[rows_b]],
+                                      names=['OrbNo','OrbitalEnergy','OrbNo(B)','OrbitalEnergy(B)'])
+    return pd.DataFrame(diff, index=index, columns=columns)
+
+# key of a plot: hash of the plotted table (index, columns, values) and the render settings
+def plot_key(data, *settings):
+    key = hashlib.sha1(repr((plot_version, list(data.columns), settings)).encode())
+    key.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+    return key.hexdigest()
+
+# True if the plot 'name' has to be drawn (changed key or missing file)
+# the plot is registered in plots_of_run, a changed plot is removed from the manifest
+# on disk until it is drawn (an interrupted run does not leave wrong keys)
+def plot_changed(name, key):
+    plots_of_run[name] = key
+    if plot_manifest.get(name) == key and ops.path.exists(name):
+        return False
+    if plot_manifest.pop(name, None) is not None:
+        write_cache_record(plot_manifest_name, plot_manifest)
+    return True
+
+# subcommand 'cache stats' or 'cache prune' for the cache directory
+if sys.argv[1:2] == ['cache'] and sys.argv[2:3] in (['stats'], ['prune']):
+    cache_parser = argparse.ArgumentParser(prog='orca_orb cache', 
+                                           description='Show (stats) or prune (prune) the cache directory.\n'
+                                           'prune deletes least recently used entries until the size limit is met.',
+                                           formatter_class=argparse.RawTextHelpFormatter)
+    cache_parser.add_argument('command', choices=['stats','prune'])
+    cache_parser.add_argument('--cache-dir', default=ops.environ.get('ORCA_ORB_CACHE'),
+                              help='the cache directory (default: $ORCA_ORB_CACHE)\n')
+    cache_parser.add_argument('--cache-size', type=size_check, default=cache_size,
+                              help='size limit, e.g. 500MB or 2GB (default: 10GB)\n')
+    cache_args = cache_parser.parse_args(sys.argv[2:])
+    if cache_args.cache_dir is None or not ops.path.isdir(cache_args.cache_dir):
+        cache_parser.error('no cache directory. Use --cache-dir or set ORCA_ORB_CACHE.')
+        
+    cache_index = read_cache_record(cache_index_name(cache_args.cache_dir)) or {}
+    if cache_args.command == 'prune':
+        with cache_lock(cache_args.cache_dir):
+            cache_index = read_cache_record(cache_index_name(cache_args.cache_dir)) or {}
+            deleted = cache_prune(cache_args.cache_dir, cache_index, cache_args.cache_size)
+        print(f'Deleted {len(deleted)} entries ({sum(item["size"] for item in deleted)/2**20:.1f} MB).\n')
+        cache_index = read_cache_record(cache_index_name(cache_args.cache_dir))
+    print_cache_stats(cache_args.cache_dir, cache_index, cache_args.cache_size)
+    exit()
+
 # parse arguments
 parser = argparse.ArgumentParser(prog='orca_orb', 
-                                 description='Analyze '+look_for_loewdin+'.\n'
+                                 description='Analyze '+' or '.join(look_for_sections.values())+'.\n'
                                  '---------------------------------------------------\n'
                                  'Summation of single contributions of elements, atoms, and AOs '
                                  'for a range of given orbitals.\n'
@@ -324,132 +1532,459 @@ parser.add_argument('-a','--aorbitals',
 parser.add_argument('-ncsv','--newcsv',
         default=0, action='store_true',
         help='build new CSV file with orbitals\n')
+
+parser.add_argument('-j','--jobs', type=int,
+        default=1,
+        help='number of processes for reading orbitals from the ORCA output\n'
+        'e.g. -j8 = read orbitals with 8 processes\n')
+
+parser.add_argument('-e','--energy-window', type=energy_window_check,
+        default=None,
+        help='specify an energy window (in Eh or eV) for the orbitals\n'
+        'e.g. -e-0.3:0.1   = analyze orbitals from -0.3 to 0.1 Eh\n'
+        'e.g. -e-8:-2eV    = analyze orbitals from -8 to -2 eV\n'
+        'e.g. -egap2eV     = analyze orbitals from E(HOMO)-2 eV to E(LUMO)+2 eV\n'
+        '(HOMO and LUMO across alpha and beta orbitals, one window for both spins)\n'
+        'use --energy-window=... for the long option\n')
+
+parser.add_argument('-s','--scheme',
+        default='loewdin', choices=list(look_for_sections),
+        help='population scheme (section) for the analysis\n'
+        'e.g. -s mulliken = analyze '+look_for_sections['mulliken']+'\n'
+        'all sections found are read at once\n')
+
+parser.add_argument('--cache-dir',
+        default=ops.environ.get('ORCA_ORB_CACHE'),
+        help='keep CSV files, datasets and records in this cache directory\n'
+        'instead of next to the ORCA output (default: $ORCA_ORB_CACHE)\n'
+        'orca_orb.py cache stats (or prune) shows (or prunes) the cache directory\n')
+
+parser.add_argument('--cache-size', type=size_check,
+        default=cache_size,
+        help='size limit of the cache directory, e.g. 500MB or 2GB (default: 10GB)\n'
+        'least recently used entries are deleted\n')
+
+parser.add_argument('-m','--memory-limit', type=size_check,
+        default=None,
+        help='memory limit for reading the section, e.g. 4GB (without unit in MB)\n'
+        'the section is read in memory, in parallel or in chunks,\n'
+        'depending on its estimated size (see -j)\n'
+        'default: no limit, read in memory (in parallel with -j)\n')
+
+parser.add_argument('-i','--info',
+        default=0, action='store_true',
+        help='print orbital numbers, HOMO/LUMO, elements and atoms of the section\n'
+        'no analysis, no plots\n')
+
+parser.add_argument('-x','--export',
+        default=None, metavar='FILE',
+        help='export the orbitals of the section (all rows of the CSV file)\n'
+        'with the info record as Arrow IPC stream to FILE (- for stdout)\n'
+        'no analysis, no plots, needs pyarrow\n'
+        'e.g. -x my-calc.arrows = export to my-calc.arrows\n'
+        'e.g. -x -              = export to stdout, messages go to stderr\n')
+
+parser.add_argument('--threshold-sweep',
+        default=0, action='store_true',
+        help='number and contribution of the atom, red. AO and AO entries and the\n'
+        'estimated size of o-analysis.txt for thresholds from 0 to 100%% (in steps\n'
+        'of --sweep-step) in o-sweep.txt and th-sweep.png, no analysis\n'
+        'orbital range and constraints are applied\n')
+
+parser.add_argument('--sweep-step', type=sweep_check,
+        default=1, metavar='STEP',
+        help='step of the thresholds for --threshold-sweep in %% (default: 1)\n'
+        'e.g. --sweep-step 0.5 = thresholds 0, 0.5, 1, ... 100%%\n')
+
+parser.add_argument('--localization',
+        default=0, action='store_true',
+        help='localization of each orbital: inverse participation ratio (IPR) over\n'
+        'atoms (and fragments, see -f), entropy of the atom shares and share of the\n'
+        'dominant element in o-localization.txt, no analysis\n'
+        'orbital range and energy window are applied, constraints are not\n')
+
+parser.add_argument('--min-ipr', type=ipr_check,
+        default=0, metavar='MIN_IPR',
+        help='only orbitals with IPR >= MIN_IPR are listed by --localization (default: all)\n'
+        'e.g. --localization --min-ipr 0.5 -oh10 = orbitals HOMO-10...HOMO+10 with IPR >= 0.5\n')
+
+parser.add_argument('-k','--top', type=top_check,
+        default=None,
+        help='list only the K largest atom, red. AO and AO contributions\n'
+        'to each orbital and the leftover (Rest) of each orbital\n'
+        'replaces the summaries of atom and AO contributions\n'
+        'e.g. -k3 = list the three largest contributions to each orbital\n')
+
+parser.add_argument('-p','--pdos',
+        default=0, action='store_true',
+        help='write the projected density of states (PDOS) of the analyzed orbitals\n'
+        'to pdos-a.csv and pdos-a.png (projection see --project)\n')
+
+parser.add_argument('--project',
+        default='element', choices=['element','atom','shell','fragment'],
+        help='projection of the PDOS (-p) onto elements (default), atoms,\n'
+        'shells (s, p, d, f of an atom) or fragments (see -f)\n'
+        'e.g. -p --project atom = PDOS projected onto atoms\n')
+
+parser.add_argument('-b','--broadening', type=broadening_check,
+        default=('gauss', 0.3 / hartree_to_ev),
+        help='broadening function and FWHM (in Eh or eV) for the PDOS\n'
+        'default: gauss0.3eV\n'
+        'e.g. -b lorentz0.2eV = Lorentzian functions with a FWHM of 0.2 eV\n'
+        'e.g. -b gauss0.01    = Gaussian functions with a FWHM of 0.01 Eh\n')
+
+parser.add_argument('-g','--grid', type=grid_check,
+        default=None,
+        help='energy grid (in Eh or eV) for the PDOS, low:high:step\n'
+        'default: energies of the analyzed orbitals +/- 3 FWHM, step FWHM/10\n'
+        'e.g. -g-20:5:0.01eV = from -20 to 5 eV in steps of 0.01 eV\n'
+        'use --grid=... for the long option\n')
+
+parser.add_argument('-d','--compare',
+        default=None, metavar='FILE',
+        help='compare element, atom and shell contributions of the orbitals\n'
+        'with the orbitals of another ORCA output FILE (the CSV file of FILE must exist)\n'
+        'differences (this - other) are listed and plotted in cmp-cntrb-a.png\n'
+        'e.g. -d my-hs.out    = compare with the orbitals in my-hs.out\n')
+
+parser.add_argument('--compare-spins',
+        default=0, action='store_true',
+        help='compare element, atom and shell contributions of alpha and beta orbitals\n'
+        'differences (alpha - beta) are listed and plotted in cmp-cntrb-a.png\n')
+
+parser.add_argument('-l','--align',
+        default='index', choices=['index','energy'],
+        help='align the orbitals for -d by orbital number (default)\n'
+        'or by energy (orbital with the nearest energy)\n')
+
+parser.add_argument('-f','--fragments', type=fragments_check,
+        default=None,
+        help='specify fragments (named groups of atoms) in a file or inline\n'
+        'file: one fragment per line, e.g. Cp ring 1: 1-5\n'
+        'e.g. -f frag.txt             = fragments from the file frag.txt\n'
+        'e.g. -f "metal=Fe;Cp=1-10,H" = fragments \'metal\' (Fe atoms) and\n'
+        '                               \'Cp\' (atoms 1 to 10 & H atoms)\n'
+        'atoms in no fragment are summed up in \'Rest\'\n')
         
 args = parser.parse_args()
 
 threshold=float(args.threshold)
 
-# open orca output file
-with open(args.filename,'r') as orca_out_file_name:
-        orca_out = orca_out_file_name.readlines()
-        #orca_out_file_name.close()  
-
-# search for occurrences of LOEWDIN REDUCED ORBITAL POPULATIONS PER MO   
-# keep line number of last occurrence
-for i,line in enumerate(orca_out):  
-    if look_for_loewdin in line: 
-        loewdin_last=i
-
-# end script if LOEWDIN REDUCED ORBITAL POPULATIONS PER MO is not in out file 
-# print error message
-if loewdin_last is False:  
-    print("\n",look_for_loewdin,"not found in '"
-          + orca_out_file_name.name+"'.")
-    exit()
- 
+# export needs pyarrow (optional), messages go to stderr if the stream goes to stdout
+if args.export is not None:
+    if importlib.util.find_spec('pyarrow') is None:
+        print('\nWarning! The export (-x) needs pyarrow (pip install pyarrow). Quit')
+        exit()
+    if args.export == '-':
+        export_sink = sys.stdout.buffer
+        sys.stdout = sys.stderr
+    else:
+        export_sink = args.export
+
+# parallel reading needs the 'fork' start method (not available on Windows)
+if args.jobs > 1 and 'fork' not in mp.get_all_start_methods():
+    print('\nWarning! Parallel reading is not available on this system. Using one process.')
+    args.jobs = 1
+
+# PDOS of fragments needs fragments
+if args.pdos and args.project == 'fragment' and args.fragments is None:
+    print('\nWarning! No fragments have been specified (-f). The PDOS is projected onto elements.')
+    args.project = 'element'
+
+# cache directory: entries of the ORCA output(s) used in this run
+cache_entries = {}
+if args.cache_dir is not None:
+    ops.makedirs(args.cache_dir, exist_ok=True)
+    cache_entries[cache_entry(args.cache_dir, args.filename)] = args.filename
+    if args.compare is not None and ops.path.exists(args.compare):
+        compare_entry = cache_entry(args.cache_dir, args.compare, create=False)
+        if compare_entry is not None:
+            cache_entries[compare_entry] = args.compare
+
+# -d and --compare-spins cannot be combined
+if args.compare is not None and args.compare_spins:
+    print('\nWarning! -d and --compare-spins cannot be combined. Alpha and beta orbitals will be compared.')
+    args.compare = None
+
+# the other ORCA output for -d needs a valid CSV file (dataset): same size and fingerprint
+if args.compare is not None:
+    compare_record = read_cache_record(csv_file_name(args.compare, args.scheme)+'.json')
+    if (compare_record is None or compare_record.get('version') != cache_version or 
+        not ops.path.exists(dataset_file_name(args.compare, args.scheme)) or
+        not ops.path.exists(args.compare) or compare_record['size'] != ops.path.getsize(args.compare) or
+        compare_record['fingerprint'] != fingerprint(args.compare, compare_record['size'])):
+        print(f'\nWarning! No valid CSV file of {args.compare} found. Run orca_orb.py {args.compare} first.\n'
+              'No comparison will be made.')
+        args.compare = None
+
+# the selected section
+look_for_section = look_for_sections[args.scheme]
+
+# size of the ORCA output, the CSV file, its cache record and the info record
+orca_out_size = ops.path.getsize(args.filename)
+csv_name = csv_file_name(args.filename, args.scheme)
+csv_record_name = csv_name+'.json'
+csv_info_name = csv_name+'.info.json'
+dataset_name = dataset_file_name(args.filename, args.scheme)
+csv_record = None
+
+# -i option: answer from the info record if it matches the ORCA output
+# (no pandas, no plots), otherwise build the CSV file first
+if args.info:
+    csv_info = read_cache_record(csv_info_name)
+    if (not args.newcsv and csv_info is not None and csv_info.get('version') == cache_version and 
+        csv_info['size'] == orca_out_size and 
+        csv_info['fingerprint'] == fingerprint(args.filename, orca_out_size)):
+        print_info(csv_info)
+        if cache_entries:
+            cache_update(args.cache_dir, cache_entries, args.cache_size)
+        exit()
+
+import numpy as np   # numpy arrays
+import pandas as pd  # pandas tables
+from orca_dataset import write_dataset, write_dataset_rows, open_dataset, dataset_tables, dataset_frame # dataset
+import seaborn as sns; sns.set(context='paper',font_scale=0.7) # for the plots
+import matplotlib.pyplot as plt                                # for the plots
+
+
+# do not truncate tables
+pd.set_option('display.max_columns',9)
+pd.set_option('display.width',1000)
+pd.set_option('display.max_rows',None)
+
+
+# plots of previous runs
+# plots are only drawn again if their data or render settings have changed (see plot_changed)
+# plots_of_run collects the plots of this run, the others are deleted at the end
+# runs without analysis (-i, -x, --threshold-sweep, --localization) quit before and keep the
+# plots and o-analysis.txt of the last analysis
+plot_manifest = read_cache_record(plot_manifest_name) or {}
+plots_of_run = {}
+
+
 ###############################################################################
 # most important section
 # read orbitals in table oall
 # save orbitals as .csv 
 # open csv file with orbitals if available (faster analysis)
+# the cache record (.csv.json) keeps size and fingerprint of the ORCA output
+# the CSV file was built from, so a grown ORCA output (restarted or continued
+# calculation) only needs the appended part to be searched for a new section
+# all supported sections that have to be read are read at once, 
+# each into its own CSV file
+
+sections = {} # sections to read: scheme: byte offset 
 
 # check for csv file and read into data frame if available
-if ops.path.isfile(args.filename+'.csv') == True:
+if ops.path.isfile(csv_name) == True:
     
-    print('\nFound '+args.filename+'.csv in folder.')
+    print('\nFound '+csv_name+' in folder.')
     
     if args.newcsv !=0:
-        print('\n-ncsv option active. Building new '+args.filename+'.csv.')
+        print('\n-ncsv option active. Building new '+csv_name+'.')
         
-    if args.newcsv == 0:
-        oall=pd.read_csv(args.filename+'.csv')  # load csv file
-        old_csv=1                               # set to 1 if successsful
-        # check for beta orbitals in the csv file
-        if len(oall[(oall.orb_spin > 0)]):
-            spin=1                             # set to 1 if found
     else:
-        old_csv=0
+        csv_record = read_cache_record(csv_record_name)
+        csv_info = read_cache_record(csv_info_name)
         
-print('\nReading orbitals from file.\n') 
-
-# no csv file with orbitals = make new one
-if old_csv == 0: 
-    
-    for line in orca_out[loewdin_last+1:]:    
-
-        if "SPIN DOWN" in line: # check for beta orbitals
-            spin=1              # set to 1 if found
+        if (csv_record is None or csv_record.get('version') != cache_version or csv_info is None or
+            not ops.path.isfile(dataset_name)):
+            print('\nNo cache record for '+csv_name+'. Building new '+csv_name+'.')
+            csv_record = None
             
-        if not "--" in line and not "SPIN" in line and not "THRESHOLD" in line:
+        elif (orca_out_size == csv_record['size'] and 
+              fingerprint(args.filename, orca_out_size) == csv_record['fingerprint']):
+            old_csv=1 # unchanged ORCA output
             
-            if emptyline.match(line):
-  
-                if raworbitals:
-                    en=pd.DataFrame(raworbitals[0:3]) # orb_no, energy, occ
-                    oc=pd.DataFrame(raworbitals[3:])  # atom_no, element, orbital, contribution
-                    ob=pd.DataFrame(dict(atom_no=oc[0],element=oc[1],orbital=oc[2]))
-                    
-                    for i in range(0,len(en.loc[0])):
-                        ob.insert(loc=3,column='orb_comp',value=oc[3+i])    # insert contribution
-                        ob.insert(loc=0,column='orb_num',value=en.loc[0,i]) # insert orb_no
-                        ob.insert(loc=1,column='orb_spin',value=spin)       # insert orb_spin
-                        ob.insert(loc=2,column='orb_en',value=en.loc[1,i])  # insert orb_en
-                        ob.insert(loc=3,column='orb_occ',value=en.loc[2,i]) # insert occ
-                        
-                        if i==0:
-                            os=pd.DataFrame(ob)                # initialize DataFrame for os
-                        else:
-                            os=os.append(ob,ignore_index=True) # final table from block
-                            
-                        # delete rows that will be replaced by the next insertion
-                        ob=ob.drop(columns=['orb_num','orb_spin','orb_en','orb_occ','orb_comp'])
-                        
-                emptyline_count +=1      # 1 empty line = end of the small orbital block
-                
-                if emptyline_count == 2: # 2 empty lines = end of the whole orbital block
-                   break                 # exit the loop
-                   
-                if first_time == False:
-                     oall=pd.DataFrame(os) # initialize DataFrame for oall
-                     first_time=True       # but only once
-                     
+        elif (orca_out_size > csv_record['size'] and 
+              fingerprint(args.filename, csv_record['size']) == csv_record['fingerprint']):
+            # grown ORCA output, search the appended part only
+            # (go back a bit in case the line with the section was cut off before)
+            # sections found there are the last ones in the ORCA output
+            print('\n'+args.filename+' has grown. Searching the appended part.')
+            sections = find_last_sections(args.filename, 
+                       max(csv_record['size'] - max(map(len, look_for_sections.values())), 0))
+            
+            if sections.get(args.scheme, -1) <= csv_record['section']:
+                if csv_record['complete']:
+                    old_csv=1 # no new section, the CSV file is still valid
+                    sections.pop(args.scheme, None)
                 else:
-                    oall=oall.append(os,ignore_index=True)  # combine single block tables to a big table
-                raworbitals=[]                              # reset list of lines
+                    sections[args.scheme] = csv_record['section'] # section was incomplete, read it again
                 
-            else:
-                emptyline_count = 0 # reset empty line counter
-                
-            if emptyline_count == 0: 
-                raworbitals.append(line.strip().split()) # split line in words
+        else:
+            print('\n'+args.filename+' does not match '+csv_name+'. Building new '+csv_name+'.')
+            csv_record = None
+            
+# no (valid) csv file with orbitals = search for all sections
+# keep byte offset of last occurrence
+if old_csv == 0 and csv_record is None:
+    sections = find_last_sections(args.filename)
+    
+    # end script if the section is not in out file 
+    # print error message
+    if args.scheme not in sections:  
+        print("\n",look_for_section,"not found in '"
+              + args.filename+"'.")
+        exit()
+
+# sections of other schemes are not read again if their CSV files already hold them
+# (e.g. updated by a run with -s of that scheme after the ORCA output has grown)
+if not args.newcsv:
+    for scheme in [scheme for scheme in sections if scheme != args.scheme]:
+        if section_cached(args.filename, scheme, sections[scheme]):
+            sections.pop(scheme)
+
+# read all sections found and make new csv files
+if sections:
+    orca_out_fingerprint = fingerprint(args.filename, orca_out_size)
     
-    # assign dtypes to columns (not for str)
-    oall['orb_num']=oall.orb_num.astype('int64')
-    oall['orb_en']=oall.orb_en.astype('float64')   
-    oall['orb_occ']=oall.orb_occ.astype('float32') 
-    oall['atom_no']=oall.atom_no.astype('int64')
-    oall['orb_comp']=oall.orb_comp.astype('float64')  
+for scheme, section_last in sections.items():
     
-    # insert reduced orbital description (s,p,d) row in data frame
-    oall.insert(loc=6,column='orb_red',value=oall.apply(lambda row: row.orbital[0],axis=1))
+    # a section of another scheme that cannot be read (e.g. cut off by a running job) does not stop
+    # the analysis of the selected section, it is skipped (and read again by the next run)
+    try:
+        # in memory, in parallel or in chunks (from the estimated size of the section and -m)
+        blocks, section_complete = locate_blocks(args.filename, section_last)
+        
+        # no complete block yet (e.g. a running job has just written the header of the section)
+        if not blocks:
+            if scheme == args.scheme:
+                print(f'\nWarning! No complete orbital block in the {scheme} section of {args.filename} yet. Quit\n')
+                exit()
+            print(f'\nWarning! No complete orbital block in the {scheme} section yet. Section skipped.\n')
+            continue
+        engine, jobs, chunk_size, est_rows, est_memory = select_engine(args.filename, blocks, 
+                                                                       args.memory_limit, args.jobs)
+        if args.memory_limit is not None:
+            print(f'\nSection ({scheme}): {size_str(blocks[-1][1] - blocks[0][0])} in {len(blocks)} blocks, '
+                  f'about {est_rows} rows ({size_str(est_memory)} in memory, '
+                  f'limit {size_str(args.memory_limit)}).')
+        if engine == 'parallel':
+            print(f'\nReading orbitals ({scheme}) from file with {jobs} processes.\n') 
+        elif engine == 'chunked':
+            print(f'\nReading orbitals ({scheme}) from file in chunks of {size_str(chunk_size)}.\n') 
+            if chunk_size < blocks[0][1] - blocks[0][0]:
+                print('Warning! The memory limit is probably too low for this section.\n')
+        else:
+            print(f'\nReading orbitals ({scheme}) from file.\n') 
+    
+        # write data frame as csv file to hd
+        # oall of the selected section is taken from the dataset later (also after reading in chunks, 
+        # then the chunks are written to the CSV file)
+        section_csv_name = csv_file_name(args.filename, scheme)
+        if engine == 'chunked':
+            section_orbitals, section_rows, section_categories = read_orbitals_chunked(args.filename, blocks, 
+                                                                                      chunk_size, section_csv_name)
+            section_orbitals = energy_index(section_orbitals)
+            write_dataset_rows(dataset_file_name(args.filename, scheme), section_rows, section_categories, 
+                               section_orbitals)
+            # atoms of the section (atom_no, element)
+            atom_keys = np.unique(section_rows['atom_no'].astype('int64') * len(section_categories['element']) 
+                                  + section_rows['element'])
+            section_oall = None
+            section_atoms = pd.DataFrame(dict(atom_no=atom_keys // len(section_categories['element']),
+                element=np.array(section_categories['element'], dtype=object)[atom_keys % len(section_categories['element'])]))
+        else:
+            section_oall, section_orbitals = read_orbitals(args.filename, blocks, jobs)
+            section_orbitals = energy_index(section_orbitals)
+            write_csv(section_csv_name, section_oall, jobs)
+            write_dataset(dataset_file_name(args.filename, scheme), section_oall, section_orbitals)
+            section_atoms = section_oall
+    except (ValueError, IndexError, KeyError) as error:
+        if scheme == args.scheme:
+            raise
+        print(f'\nWarning! The {scheme} section could not be read ({error!r}). Section skipped.\n')
+        continue
+    print('Data frame saved to disk as '+section_csv_name+'\n')
+    
+    # cache and info record
+    section_record = dict(version=cache_version, section=section_last, complete=section_complete,
+                          orbitals=section_orbitals.to_dict('list'))
+    section_info = orbital_info(section_orbitals, section_atoms)
+    section_info.update(version=cache_version, source=args.filename, scheme=scheme, section=section_last)
+    
+    for record, record_name in ((section_record, section_csv_name+'.json'), 
+                                (section_info, section_csv_name+'.info.json')):
+        record['size'] = orca_out_size
+        record['fingerprint'] = orca_out_fingerprint
+        write_cache_record(record_name, record)
+        
+    if scheme == args.scheme:
+        orbitals, csv_record, csv_info = section_orbitals, section_record, section_info
+        old_csv = 1 # oall from the dataset (decoded), like from a valid CSV file
+    section_oall = section_atoms = None
 
-# write data frame as csv file to hd
-if ops.path.isfile(args.filename+'.csv') == False or args.newcsv !=0:
+if old_csv == 1:
+    orbitals=pd.DataFrame(csv_record['orbitals']) # energy index
     
-    oall.to_csv(args.filename+'.csv')
-    print('Data frame saved to disk as '+args.filename+'.csv\n')
+    # map the dataset, oall is taken later (orbitals in the orbital range and the energy window)
+    dataset=open_dataset(dataset_name)
+        
+    # update the cache and info record if only the size of the ORCA output has changed
+    if csv_record['size'] != orca_out_size:
+        for record, record_name in ((csv_record, csv_record_name), (csv_info, csv_info_name)):
+            record['size'] = orca_out_size
+            record['fingerprint'] = fingerprint(args.filename, orca_out_size)
+            write_cache_record(record_name, record)
+
+# cache directory: size and time of use of the entries, delete least recently used entries
+if cache_entries:
+    cache_update(args.cache_dir, cache_entries, args.cache_size)
+
+# check for beta orbitals
+if len(orbitals[(orbitals.orb_spin > 0)]):
+    spin=1 # set to 1 if found
+    unrestricted=1
 
 ###############################################################################
 # get total number of orbitals (alpha & beta)
-tot_num_of_orb=oall.groupby(['orb_spin'], as_index=False)['orb_num'].max()
+tot_num_of_orb=orbitals.groupby(['orb_spin'], as_index=False)['orb_num'].max()
 tot_num_of_orb_a=tot_num_of_orb.loc[0,'orb_num']
 
 if spin==1:
     tot_num_of_orb_b=tot_num_of_orb.loc[1,'orb_num'] # beta orbitals
     
 # get orbital no of the HOMO
-homo_num = oall.groupby(['orb_occ'], as_index=False)['orb_num'].max()
-homo_num = homo_num.loc[1,'orb_num']
+# (an incomplete section of a running job may have no virtual orbitals yet)
+homo_num = orbitals.loc[orbitals.orb_occ > 0, 'orb_num'].max()
+if pd.isna(homo_num):
+    print('Warning! No occupied orbitals found. Quit\n')
+    exit()
+
+# -i option: print metadata and quit
+if args.info:
+    print_info(csv_info)
+    exit()
+
+# -x option: export the dataset as Arrow IPC stream and quit
+if args.export is not None:
+    n_rows, n_batches = export_arrow(open_dataset(dataset_name), csv_info, export_sink)
+    print(f'\nExported {n_rows} rows ({n_batches} record batches) to '
+          + ('stdout' if args.export == '-' else args.export) + '.\n')
+    exit()
+
+###############################################################################
+# get the orbitals in the energy window (from argparse)
+# binary search in the energy index
+# only the rows of orbitals in the window are taken from the dataset (see below)
+
+if args.energy_window is not None:
+    
+    gap, e_low, e_high = args.energy_window
+    
+    if gap:
+        # window around the HOMO/LUMO gap, LUMO = HOMO if no virtual orbitals
+        # HOMO and LUMO across both spins (one window for alpha and beta orbitals)
+        e_homo = orbitals[(orbitals.orb_occ > 0)].orb_en.max()
+        e_lumo = orbitals[(orbitals.orb_occ == 0)].orb_en.min()
+        e_low, e_high = e_homo - e_low, (e_homo if pd.isna(e_lumo) else e_lumo) + e_high
+    
+    orbitals_in_window = select_energy_window(orbitals, e_low, e_high)
+    
+    if len(orbitals_in_window) == 0:
+        print(f'Warning! No orbitals in the energy window {e_low:.5f}...{e_high:.5f} Eh. Quit\n')
+        exit()
 
 ###############################################################################
 # get the numbers of orbitals to process (from argparse) 
@@ -494,6 +2029,48 @@ else:
     print('Warning! Malformed parameter. Check your input. Quit\n')
     exit()
     
+# orbital range and energy window
+if args.energy_window is not None:
+    orb_start = max(orb_start, orbitals_in_window.orb_num.min())
+    orb_end = min(orb_end, orbitals_in_window.orb_num.max())
+    
+    if orb_start > orb_end:
+        print('Warning! No orbitals in the energy window and the orbital range. Quit\n')
+        exit()
+        
+    print(f'Energy window {e_low:.5f}...{e_high:.5f} Eh. Analyzing orbitals {orb_start}...{orb_end}.\n')
+    
+    # spins with orbitals in the energy window and the orbital range
+    # the tables and plots of beta orbitals are only made if there are beta orbitals (spin)
+    spins_in_window = set(orbitals_in_window[(orbitals_in_window.orb_num >= orb_start) & 
+                                             (orbitals_in_window.orb_num <= orb_end)].orb_spin)
+    if 0 not in spins_in_window:
+        print('Warning! No alpha orbitals in the energy window and the orbital range. Quit\n')
+        exit()
+    if spin == 1 and 1 not in spins_in_window:
+        print('Warning! No beta orbitals in the energy window and the orbital range. '
+              'Only alpha orbitals are analyzed.\n')
+        spin = 0
+    
+# error message if range of orbitals is exceeded
+if orb_start < 0 or orb_end < 0 or orb_end > tot_num_of_orb_a:
+    print(f'Warning! Value exceeds range of orbitals: 0...{tot_num_of_orb_a}. Quit\n')
+    exit()
+
+###############################################################################
+# take the orbitals in the orbital range (and the energy window) from the dataset, only their rows
+# the table of their rows has to fit into the memory limit
+
+orbitals_selected = orbitals_in_window if args.energy_window is not None else orbitals
+orbitals_selected = orbitals_selected[(orbitals_selected.orb_num >= orb_start) & 
+                                      (orbitals_selected.orb_num <= orb_end)]
+if args.memory_limit is not None and table_memory(orbitals_selected) > args.memory_limit:
+    print(f'Warning! The analysis of the orbitals needs about {size_str(table_memory(orbitals_selected))} '
+          f'of memory (limit {size_str(args.memory_limit)}).\n'
+          'Use a smaller -o (orbital range) or -e (energy window), -i (info) or -x (export). Quit.\n')
+    exit()
+oall = dataset_frame(dataset, row_ranges(orbitals_selected))
+    
 ###############################################################################
 # get the constraints (from argparse) 
 # Element constraints are in the list: list_of_elements
@@ -593,10 +2170,79 @@ else:
     #      'No heat map plots of AO contributions of atoms to orbital will be created.\n')
     sel_atom_ao='none'
     constr_for_atoms_set=False
-     
-# error message if range of orbitals is exceeded
-if orb_start < 0 or orb_end < 0 or orb_end > tot_num_of_orb_a:
-    print(f'Warning! Value exceeds range of orbitals: 0...{tot_num_of_orb_a}. Quit\n')
+
+###############################################################################
+# --threshold-sweep: entries, contribution and size of o-analysis.txt for all thresholds
+# in one pass, table o-sweep.txt and plot th-sweep.png, no analysis
+
+if args.threshold_sweep:
+    sweep = threshold_sweep(oall[(oall.orb_num >= orb_start) & (oall.orb_num <= orb_end) &
+                                 oall.element.isin(list_of_elements) & oall.atom_no.isin(list_of_atoms)
+                                 ].rename(oall_columns, axis='columns'),
+                            np.unique(np.append(np.arange(0, 100, args.sweep_step), 100)))
+    
+    with open('o-sweep.txt','w') as file:
+        file.write('==================================================================\n')
+        file.write(' '.join((look_for_section,'threshold sweep of',args.filename+'\n')))
+        file.write(f'Analyzed orbitals         : {orb_start}...{orb_end}\n')
+        file.write("Applied constraints       : " +appl_constr.translate({ord(c): None for c in "[]',"})+"\n")
+        file.write('Entries (and their contribution in % of all contributions) >= threshold\n'
+                   'and estimated size of o-analysis.txt\n')
+        file.write('==================================================================\n')
+        file.write(sweep.round(2).to_string(index=True)+'\n')
+    
+    fig, (ax1, ax2) = plt.subplots(2, 1, sharex=True)
+    sweep[['Atoms','Shells','AOs']].plot(ax=ax1, linewidth=0.8, legend=False)
+    ax1.set_yscale('symlog')
+    ax1.set_ylim(bottom=0)
+    ax1.set_ylabel('Entries')
+    ax_size = ax1.twinx()
+    ax_size.plot(sweep.index, sweep['Size (kB)'], color='black', linestyle=':', linewidth=0.8, label='Size (kB)')
+    ax_size.set_yscale('log')
+    ax_size.set_ylabel('o-analysis.txt (kB)')
+    ax_size.grid(False)
+    ax1.legend(ax1.get_lines() + ax_size.get_lines(), ['Atoms','Shells','AOs','Size (kB)'], loc='upper right')
+    sweep[['Atoms (%)','Shells (%)','AOs (%)']].plot(ax=ax2, linewidth=0.8)
+    ax2.set_ylabel('Contribution (%)')
+    ax2.set_xlim(0, 100)
+    for ax in (ax1, ax2):
+        ax.axvline(threshold, color='gray', linestyle='--', linewidth=0.8)
+    ax1.set_title(f'Threshold sweep of orbitals {orb_start}...{orb_end}. '
+                  f'Threshold {threshold}%: about {np.interp(threshold, sweep.index, sweep["Size (kB)"]):.0f} kB.')
+    
+    plt.tight_layout()
+    fig.savefig('th-sweep.png',dpi=300)
+    plt.close(fig)
+    
+    print('Threshold sweep written to o-sweep.txt and th-sweep.png.\n')
+    exit()
+
+###############################################################################
+# --localization: IPR, entropy and dominant element of each orbital (no constraints)
+# o-localization.txt, orbitals with IPR >= MIN_IPR, no analysis
+
+if args.localization:
+    with open('o-localization.txt','w') as file:
+        file.write('==================================================================\n')
+        file.write(' '.join((look_for_section,'localization of orbitals in',args.filename+'\n')))
+        file.write(f'Analyzed orbitals         : {orb_start}...{orb_end}\n')
+        file.write(' '.join(("Orbital no. of the HOMO   :", str(homo_num)+'\n')))
+        file.write(f'Min. IPR                  : {args.min_ipr}\n')
+        if args.fragments is not None:
+            file.write("Fragments                 : " +', '.join(name for name, _ in args.fragments)+"\n")
+        file.write('IPR = sum(p^2), Entropy = -sum(p ln p), p = share of each atom (fragment)\n')
+        file.write('==================================================================\n')
+        
+        for spin_no, spin_str in ((0, ' (alpha)' if unrestricted == 1 else ''), (1, ' (beta)'))[:spin+1]:
+            loc_table = oall[(oall.orb_spin == spin_no) & (oall.orb_num >= orb_start) & (oall.orb_num <= orb_end)]
+            if loc_table.empty: # no orbitals of this spin in the range
+                continue
+            loc = localization(loc_table.rename(oall_columns, axis='columns'), args.fragments)
+            file.write(f'\nLocalization (IPR >= {args.min_ipr}) of orbitals'+spin_str+':\n'
+                        '==================================================================\n')
+            file.write(loc[(loc.IPR >= args.min_ipr)].round(4).to_string(index=True)+'\n')
+    
+    print('Localization written to o-localization.txt.\n')
     exit()
 
 ###############################################################################
@@ -606,7 +2252,7 @@ if orb_start < 0 or orb_end < 0 or orb_end > tot_num_of_orb_a:
 file = open('o-analysis.txt','w')  # open file
     
 file.write('==================================================================\n')
-file.write(' '.join((look_for_loewdin,'analysis of',args.filename+'\n')))
+file.write(' '.join((look_for_section,'analysis of',args.filename+'\n')))
 
 if orb_start == orb_end:
     file.write(f'Analyzed orbital          : {orb_start}\n')
@@ -614,7 +2260,7 @@ if orb_start == orb_end:
 else:
     file.write(f'Analyzed orbitals         : {orb_start}...{orb_end}\n')
     
-if spin==1:
+if unrestricted==1:
     file.write(' '.join(("Alpha spin orbitals       :",str(tot_num_of_orb_a)+'\n')))
     file.write(' '.join(("Beta spin Orbitals        :",str(tot_num_of_orb_b)+'\n')))
 
@@ -622,8 +2268,22 @@ else:
     file.write(' '.join(("Number of orbitals        :",str(tot_num_of_orb_a)+'\n')))
     
 file.write(' '.join(("Orbital no. of the HOMO   :", str(homo_num)+'\n')))
+
+if args.energy_window is not None:
+    file.write(f'Energy window (Eh)        : {e_low:.5f}...{e_high:.5f}\n')
+    
 file.write(' '.join(("Threshold for printing (%):", str(threshold)+'\n')))
+if args.top is not None:
+    file.write(f'Top contributions         : {args.top}\n')
 file.write("Applied constraints       : " +appl_constr.translate({ord(c): None for c in "[]',"})+"\n")
+if args.pdos:
+    file.write(f'PDOS                      : {args.project}, {args.broadening[0]} '
+               f'FWHM {args.broadening[1]*hartree_to_ev:.3f} eV\n')
+if args.compare_spins or args.compare is not None:
+    file.write(f'Compared with             : {"beta orbitals" if args.compare_spins else args.compare}'
+               f' (aligned by {args.align})\n')
+if args.fragments is not None:
+    file.write("Fragments                 : " +', '.join(name for name, _ in args.fragments)+"\n")
 file.write("Atoms for AO heat maps    : " +sel_atom_ao.translate({ord(c): None for c in "{}[]',"})+"\n")
 file.write('==================================================================\n')
 
@@ -636,13 +2296,10 @@ file.write('==================================================================\n
 # 
 
 # rename columns
-oall=oall.rename({'orb_num':'OrbNo','orb_spin':'Spin','orb_en':'OrbitalEnergy',
-                  'orb_occ':'Occupation','atom_no':'AtomNo','element':'Element',
-                  'orb_red':'Orb','orbital':'OrbOr','orb_comp':'Cntrb'},
-                  axis='columns')
+oall=oall.rename(oall_columns, axis='columns')
 
 # print '(alpha)' in case of open shell or '' in case of closed shell
-if spin==1:
+if unrestricted==1:
     alpha_str=' (alpha)'
     
 else:
@@ -669,39 +2326,64 @@ if spin==1:
     file.write(sum_by_el_b.reset_index().set_index(['OrbNo','OrbitalEnergy','Occupation','Element'])
                .unstack().fillna(0).to_string(index=True)+'\n')
     
+###############################################################################
+# fragment contributions (no threshold & no restraints)
+# atom contributions (orbitals x atoms) times the mapping matrix (atoms x fragments)
+# sum_by_fr[0] (alpha) & sum_by_fr[1] (beta, if open shell)
+
+sum_by_fr = {}
+if args.fragments is not None:
+    for spin_no, spin_str in ((0, alpha_str), (1, ' (beta)'))[:spin+1]:
+        sum_by_at = contribution_matrix(oall[(oall.Spin == spin_no) & (oall.OrbNo >= orb_start) & 
+                                             (oall.OrbNo <= orb_end)], 'AtomNo')
+        atoms = sum_by_at.columns.values
+        elements = oall.drop_duplicates('AtomNo').set_index('AtomNo').Element.reindex(atoms).values
+        fr_matrix, fr_names = fragment_matrix(args.fragments, atoms, elements)
+        sum_by_fr[spin_no] = pd.DataFrame(sum_by_at.values @ fr_matrix, index=sum_by_at.index,
+                                          columns=pd.Index(fr_names, name='Fragment'))
+        
+        file.write('\nSummary of fragment contributions (>= 0%) to orbitals'+spin_str+':\n'
+                   '==================================================================\n')
+        file.write(sum_by_fr[spin_no].to_string(index=True)+'\n')
+    
 ###############################################################################  
     
-file.write(f'\nSummary of atom contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
-            '==================================================================\n')
+# with --top the K largest contributions of each orbital are listed instead (see below)
 
 sum_by_at_a=oall[(oall.Spin == 0) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
             oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
             ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo']).agg({'Cntrb':'sum'})
 
-file.write(sum_by_at_a[(sum_by_at_a.Cntrb >= threshold)].to_string(index=True)+'\n')
-
-if spin==1:
-    file.write(f'\nSummary of atom contributions (>= {threshold}%) to orbitals (beta):\n'
+if args.top is None:
+    file.write(f'\nSummary of atom contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
                 '==================================================================\n')
     
+    file.write(sum_by_at_a[(sum_by_at_a.Cntrb >= threshold)].to_string(index=True)+'\n')
+
+if spin==1:
     sum_by_at_b=oall[(oall.Spin == 1) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
                 oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
                 ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo']).agg({'Cntrb':'sum'})
     
-    file.write(sum_by_at_b[(sum_by_at_b.Cntrb >= threshold)].to_string(index=True)+'\n')
+    if args.top is None:
+        file.write(f'\nSummary of atom contributions (>= {threshold}%) to orbitals (beta):\n'
+                    '==================================================================\n')
+        
+        file.write(sum_by_at_b[(sum_by_at_b.Cntrb >= threshold)].to_string(index=True)+'\n')
     
 ###############################################################################
-    
-file.write(f'\nSummary of red. AO contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
-            '==================================================================\n')
 
-sum_by_orb=oall[(oall.Spin == 0) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
-           oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
-           ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo','Orb']).agg({'Cntrb':'sum'})
-
-file.write(sum_by_orb[(sum_by_orb.Cntrb >= threshold)].to_string(index=True)+'\n')
+if args.top is None:
+    file.write(f'\nSummary of red. AO contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
+                '==================================================================\n')
+    
+    sum_by_orb=oall[(oall.Spin == 0) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
+               oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
+               ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo','Orb']).agg({'Cntrb':'sum'})
+    
+    file.write(sum_by_orb[(sum_by_orb.Cntrb >= threshold)].to_string(index=True)+'\n')
 
-if spin==1:
+if spin==1 and args.top is None:
     file.write(f'\nSummary of red. AO contributions (>= {threshold}%) to orbitals (beta):\n'
                 '==================================================================\n')
     
@@ -712,53 +2394,185 @@ if spin==1:
     file.write(sum_by_orb[(sum_by_orb.Cntrb >= threshold)].to_string(index=True)+'\n')
     
 ###############################################################################
-    
-file.write(f'\nSummary of AO contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
-            '==================================================================\n')
 
-sum_by_orb_or_a=oall[(oall.Spin == 0) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
-                oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
-                ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo','Orb','OrbOr']).agg({'Cntrb':'sum'})
+# with --top the AO tables are only needed for the heat maps of the AOs (-a)
 
-file.write(sum_by_orb_or_a[(sum_by_orb_or_a.Cntrb >= threshold)].to_string(index=True)+'\n')
+if args.top is None or constr_for_atoms_set:
+    sum_by_orb_or_a=oall[(oall.Spin == 0) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
+                    oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
+                    ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo','Orb','OrbOr']).agg({'Cntrb':'sum'})
 
-if spin==1:
-    file.write(f'\nSummary of AO contributions (>= {threshold}%) to orbitals (beta):\n'
+if args.top is None:
+    file.write(f'\nSummary of AO contributions (>= {threshold}%) to orbitals'+alpha_str+':\n'
                 '==================================================================\n')
     
+    file.write(sum_by_orb_or_a[(sum_by_orb_or_a.Cntrb >= threshold)].to_string(index=True)+'\n')
+
+if spin==1 and (args.top is None or constr_for_atoms_set):
     sum_by_orb_or_b=oall[(oall.Spin == 1) & (oall.OrbNo >= orb_start)  & (oall.OrbNo <=orb_end) &
                     oall.Element.isin(list_of_elements) & oall.AtomNo.isin(list_of_atoms)].groupby(
                     ['OrbNo','OrbitalEnergy','Occupation','Element','AtomNo','Orb','OrbOr']).agg({'Cntrb':'sum'})
     
-    file.write(sum_by_orb_or_b[(sum_by_orb_or_b.Cntrb >= threshold)].to_string(index=True)+'\n')
+    if args.top is None:
+        file.write(f'\nSummary of AO contributions (>= {threshold}%) to orbitals (beta):\n'
+                    '==================================================================\n')
+        
+        file.write(sum_by_orb_or_b[(sum_by_orb_or_b.Cntrb >= threshold)].to_string(index=True)+'\n')
     
 ###############################################################################
-    
-file.write(f'\nAOs (contribution >= {threshold}%) in orbitals'+alpha_str+':\n'
-            '==================================================================\n')
 
-ao_in_orb_a=sum_by_orb_or_a.reset_index().drop(columns=['OrbitalEnergy']).rename(
-            {'Occupation':'Occ'},axis='columns').set_index([
-            'AtomNo','Element','Orb','OrbOr','OrbNo','Occ']).sort_index()
+if args.top is None or constr_for_atoms_set:
+    ao_in_orb_a=sum_by_orb_or_a.reset_index().drop(columns=['OrbitalEnergy']).rename(
+                {'Occupation':'Occ'},axis='columns').set_index([
+                'AtomNo','Element','Orb','OrbOr','OrbNo','Occ']).sort_index()
 
 #ao_in_orb_a=ao_in_orb_a.rename({'Occupation':'Occ'},axis='index')
 
-file.write(ao_in_orb_a[(ao_in_orb_a.Cntrb >= threshold)].to_string(index=True)+'\n')
-
-if spin==1:
-    file.write(f'\nAOs (contribution >= {threshold}%) in orbitals (beta):\n'
+if args.top is None:
+    file.write(f'\nAOs (contribution >= {threshold}%) in orbitals'+alpha_str+':\n'
                 '==================================================================\n')
     
+    file.write(ao_in_orb_a[(ao_in_orb_a.Cntrb >= threshold)].to_string(index=True)+'\n')
+
+if spin==1 and (args.top is None or constr_for_atoms_set):
     ao_in_orb_b=sum_by_orb_or_b.reset_index().drop(columns=['OrbitalEnergy']).rename(
                 {'Occupation':'Occ'},axis='columns').set_index([
                 'AtomNo','Element','Orb','OrbOr','OrbNo','Occ']).sort_index() 
         
     #ao_in_orb_b=ao_in_orb_b.rename({'Occupation':'Occ'},axis='index')
     
-    file.write(ao_in_orb_b[(ao_in_orb_b.Cntrb >= threshold)].to_string(index=True)+'\n')
+    if args.top is None:
+        file.write(f'\nAOs (contribution >= {threshold}%) in orbitals (beta):\n'
+                    '==================================================================\n')
+        
+        file.write(ao_in_orb_b[(ao_in_orb_b.Cntrb >= threshold)].to_string(index=True)+'\n')
+
+###############################################################################
+# --top: the K largest atom, red. AO and AO contributions (>= threshold) to each orbital
+# and the leftover (Rest) of each orbital
+# element & atom restraints are applied (the leftover includes all contributions)
+
+if args.top is not None:
+    for spin_no, spin_str in ((0, alpha_str), (1, ' (beta)'))[:spin+1]:
+        orbs_in_range = oall[(oall.Spin == spin_no) & (oall.OrbNo >= orb_start) & (oall.OrbNo <= orb_end)]
+        selected = (orbs_in_range.Element.isin(list_of_elements) & 
+                    orbs_in_range.AtomNo.isin(list_of_atoms)).values
+        
+        for level, by in (('atom', ['Element','AtomNo']),
+                          ('red. AO', ['Element','AtomNo','Orb']),
+                          ('AO', ['Element','AtomNo','Orb','OrbOr'])):
+            file.write(f'\nTop {args.top} {level} contributions (>= {threshold}%) to orbitals'+spin_str+':\n'
+                        '==================================================================\n')
+            
+            file.write(top_contributions(orbs_in_range, by, args.top, selected, threshold)
+                       .to_string(index=True)+'\n')
+
+###############################################################################
+# -d: differences of element, atom and shell contributions of aligned orbitals
+# alpha - beta, or this - other ORCA output (same spin)
+# orbitals of this ORCA output are in the range, threshold is valid for atoms and shells
+# only the rows of the aligned orbitals are loaded, they have to fit into the memory limit
+# cmp_by_at[0] (alpha) & cmp_by_at[1] (beta) for the heat map
+
+cmp_by_at = {}
+if args.compare_spins and unrestricted == 0:
+    print('Warning! No beta orbitals found. No comparison will be made.\n')
+    
+elif args.compare_spins or args.compare is not None:
+    oall_in_range = oall[(oall.OrbNo >= orb_start) & (oall.OrbNo <= orb_end)]
+    # the orbitals aligned to the orbitals in the range are taken from the whole dataset (oall only 
+    # holds the orbitals selected by -o and -e), aligned in the energy index (orbitals) of the dataset
+    if args.compare_spins:
+        dataset_cmp, orbitals_cmp, spins_cmp = dataset, orbitals, ((0, 1),)
+    else:
+        dataset_cmp = open_dataset(dataset_file_name(args.compare, args.scheme))
+        orbitals_cmp, _ = dataset_tables(dataset_cmp)
+        spins_cmp = ((0, 0), (1, 1))[:spin+1]
+    orbs_cmp = []
+    for spin_a, spin_b in spins_cmp:
+        orbs_a = orbitals_selected[orbitals_selected.orb_spin == spin_a].sort_values('orb_num')
+        orbs_b = orbitals_cmp[orbitals_cmp.orb_spin == spin_b].sort_values('orb_num')
+        if len(orbs_b):
+            _, rows_b = align_orbitals(orbs_a.orb_num.values, orbs_a.orb_en.values, 
+                                       orbs_b.orb_num.values, orbs_b.orb_en.values, args.align)
+            orbs_cmp.append(orbs_b.iloc[np.unique(rows_b)])
+    orbs_cmp = pd.concat(orbs_cmp)
+    if args.memory_limit is not None and table_memory(orbs_cmp) > args.memory_limit:
+        print(f'Warning! The comparison (-d) needs about {size_str(table_memory(orbs_cmp))} of memory '
+              f'(limit {size_str(args.memory_limit)}).\n'
+              'Use a smaller -o (orbital range) or -e (energy window). Quit.\n')
+        exit()
+    oall_cmp = dataset_frame(dataset_cmp, row_ranges(orbs_cmp)).rename(oall_columns, axis='columns')
+    
+    if args.compare_spins:
+        pairs = [(0, '', oall_in_range[oall_in_range.Spin == 0], oall_cmp)]
+        cmp_str = 'alpha - beta'
+    else:
+        pairs = [(spin_no, spin_str, oall_in_range[oall_in_range.Spin == spin_no], 
+                  oall_cmp[oall_cmp.Spin == spin_no])
+                 for spin_no, spin_str in ((0, alpha_str), (1, ' (beta)'))[:spin+1]
+                 if (oall_cmp.Spin == spin_no).any()]
+        cmp_str = args.filename + ' - ' + args.compare
+    
+    for spin_no, spin_str, table_a, table_b in pairs:
+        for level, by in (('element', 'Element'), ('atom', ['AtomNo','Element']), 
+                          ('red. AO', ['AtomNo','Element','Orb'])):
+            cmp_by = compare_contributions(table_a, table_b, by, args.align).round(1)
+            if level == 'element':
+                file.write(f'\nDifference of element contributions ({cmp_str}) to orbitals'+spin_str+
+                           f', aligned by {args.align}:\n'
+                           '==================================================================\n')
+                file.write(cmp_by.to_string(index=True)+'\n')
+                continue
+            
+            if level == 'atom':
+                cmp_by_at[spin_no] = cmp_by
+            cmp_by = cmp_by.stack(list(range(cmp_by.columns.nlevels))).to_frame('Diff')
+            file.write(f'\nDifference of {level} contributions ({cmp_str}, |Diff| >= {threshold}%) to orbitals'
+                       +spin_str+f', aligned by {args.align}:\n'
+                       '==================================================================\n')
+            file.write(cmp_by[(cmp_by.Diff.abs() >= threshold) & (cmp_by.Diff != 0)].to_string(index=True)+'\n')
 
 file.close() # close file
 
+###############################################################################
+# PDOS section
+# projected density of states of the orbitals in the range (no threshold & no restraints)
+# the projections are the contributions (orbitals x elements/atoms/shells/fragments) / 100
+# pdos-a.csv & pdos-b.csv (if open shell), energies in eV, PDOS in 1/eV
+
+pdos_tables = {}
+if args.pdos:
+    shape, fwhm = args.broadening
+    orbs_in_range = oall[(oall.OrbNo >= orb_start) & (oall.OrbNo <= orb_end)]
+    if args.grid is not None:
+        low, high, step = args.grid
+    else:
+        low, high = orbs_in_range.OrbitalEnergy.min() - 3 * fwhm, orbs_in_range.OrbitalEnergy.max() + 3 * fwhm
+        step = max(fwhm / 10, (high - low) / pdos_points)
+        if step > fwhm / 10:
+            print('Warning! The energy range of the orbitals is large compared to the broadening.\n'
+                  'Use -g (--grid) or -e (--energy-window) for a finer PDOS.\n')
+    grid = np.arange(low, high + step / 2, step) * hartree_to_ev
+    
+    for spin_no in range(spin+1):
+        if args.project == 'fragment':
+            projections = sum_by_fr[spin_no]
+        else:
+            projections = contribution_matrix(orbs_in_range[orbs_in_range.Spin == spin_no], 
+                          {'element':'Element', 'atom':['AtomNo','Element'], 
+                           'shell':['AtomNo','Element','Orb']}[args.project])
+            if args.project != 'element':
+                projections.columns = [element + str(atom) + ('-' + orb[0] if orb else '') 
+                                       for atom, element, *orb in projections.columns]
+        energies = projections.index.get_level_values('OrbitalEnergy').values * hartree_to_ev
+        weights = np.column_stack((np.ones(len(energies)), projections.values / 100))
+        
+        pdos_tables[spin_no] = pd.DataFrame(pdos(energies, weights, grid, shape, fwhm * hartree_to_ev),
+                                            index=pd.Index(grid, name='Energy(eV)'),
+                                            columns=['Total'] + list(projections.columns))
+        pdos_tables[spin_no].to_csv('pdos-'+'ab'[spin_no]+'.csv', float_format='%.6g')
+
 ###############################################################################
 # plot section
 # 
@@ -782,70 +2596,180 @@ if spin==1:
     sum_by_el_plot_b=sum_by_el_b.reset_index().drop(columns=['OrbitalEnergy']).set_index(
                      ['OrbNo','Occupation','Element']).unstack().fillna(0)
     
-    # plot options for beta orbitals start here:
-    ax=sum_by_el_plot_b.plot.barh(xlim=(0,100),stacked=True) 
-    ax.legend(sum_by_el_plot_b.columns.get_level_values(1),loc='upper left')
-    ax.set_title('Element contributions (>= 0%) to orbitals (beta).' 
-                  f'The orbital number of the HOMO (alpha) is {homo_num}.')
+    if plot_changed('el-cntrb-b.png', plot_key(sum_by_el_plot_b, homo_num)):
+        # plot options for beta orbitals start here:
+        ax=sum_by_el_plot_b.plot.barh(xlim=(0,100),stacked=True) 
+        ax.legend(sum_by_el_plot_b.columns.get_level_values(1),loc='upper left')
+        ax.set_title('Element contributions (>= 0%) to orbitals (beta).' 
+                      f'The orbital number of the HOMO (alpha) is {homo_num}.')
+        ax.set_xlabel('Element contribution (%)')
+        ax.set_ylabel('(Orbital No., Occupation)')
+    
+        # reduce some labels in large plots
+        if len(sum_by_el_plot_b) > 30:
+            ax.set_yticklabels([t if not i%2 else "" for i,t in enumerate(ax.get_yticklabels())])
+        
+        if len(sum_by_el_plot_b) > 50:
+            ax.set_yticklabels([t if not i%4 else "" for i,t in enumerate(ax.get_yticklabels())])
+        
+        fig = ax.get_figure()
+    
+        # for very large plots of element contributions
+        if len(sum_by_el_plot_b) > 100:
+        
+           w, h=fig.get_size_inches()
+           h = len(sum_by_el_plot_b)/10+1
+           fig.set_size_inches(1.5*h, h)
+       
+           for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
+               item.set_fontsize(20)
+           
+           ax.legend(sum_by_el_plot_b.columns.get_level_values(1),loc='upper left',fontsize=20)
+      
+        plt.tight_layout()
+        fig.savefig('el-cntrb-b.png',dpi=300)
+        plt.close(fig)
+if plot_changed('el-cntrb-a.png', plot_key(sum_by_el_plot_a, homo_num, alpha_str)):
+    # plot options for (alpha) orbitals start here:
+    ax=sum_by_el_plot_a.plot.barh(xlim=(0,100),stacked=True)
+    ax.legend(sum_by_el_plot_a.columns.get_level_values(1),loc='upper left')
+    ax.set_title('Element contributions (>= 0%) to orbitals'+alpha_str+'.'
+                 +f' The orbital number of the HOMO is {homo_num}.')
     ax.set_xlabel('Element contribution (%)')
     ax.set_ylabel('(Orbital No., Occupation)')
+
+    # reduce some labels in large plots
+    if len(sum_by_el_plot_a) > 30:
+        ax.set_yticklabels([t if not i%2 else "" for i,t in enumerate(ax.get_yticklabels())])
+    
+    if len(sum_by_el_plot_a) > 50:
+        ax.set_yticklabels([t if not i%4 else "" for i,t in enumerate(ax.get_yticklabels())])
+    
+    fig = ax.get_figure()
+
+    # for very large plots of element contributions
+    if len(sum_by_el_plot_a) > 100:
+    
+        w, h=fig.get_size_inches()
+        h = len(sum_by_el_plot_a)/10+1
+        fig.set_size_inches(1.5*h, h)
+    
+        for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
+            item.set_fontsize(20)
+        
+        ax.legend(sum_by_el_plot_a.columns.get_level_values(1),loc='upper left',fontsize=20)
+    
+    plt.tight_layout()
+    fig.savefig('el-cntrb-a.png',dpi=300)
+    plt.close(fig)
+
+###############################################################################
+# plot of fragment contributions in orbitals (no threshold)
+# fr-cntrb-a.png & fr-cntrb-b.png (if open shell)
+
+for spin_no, sum_by_fr_plot in sum_by_fr.items():
+    sum_by_fr_plot = sum_by_fr_plot.droplevel('OrbitalEnergy')
+    
+    if not plot_changed('fr-cntrb-'+'ab'[spin_no]+'.png', plot_key(sum_by_fr_plot, homo_num, alpha_str)):
+        continue
+    
+    ax=sum_by_fr_plot.plot.barh(xlim=(0,100),stacked=True)
+    ax.legend(sum_by_fr_plot.columns,loc='upper left')
+    if spin_no == 0:
+        ax.set_title('Fragment contributions (>= 0%) to orbitals'+alpha_str+'.'
+                     +f' The orbital number of the HOMO is {homo_num}.')
+    else:
+        ax.set_title('Fragment contributions (>= 0%) to orbitals (beta).' 
+                     f'The orbital number of the HOMO (alpha) is {homo_num}.')
+    ax.set_xlabel('Fragment contribution (%)')
+    ax.set_ylabel('(Orbital No., Occupation)')
     
     # reduce some labels in large plots
-    if len(sum_by_el_plot_b) > 30:
+    if len(sum_by_fr_plot) > 30:
         ax.set_yticklabels([t if not i%2 else "" for i,t in enumerate(ax.get_yticklabels())])
         
-    if len(sum_by_el_plot_b) > 50:
+    if len(sum_by_fr_plot) > 50:
         ax.set_yticklabels([t if not i%4 else "" for i,t in enumerate(ax.get_yticklabels())])
         
     fig = ax.get_figure()
     
-    # for very large plots of element contributions
-    if len(sum_by_el_plot_b) > 100:
+    # for very large plots of fragment contributions
+    if len(sum_by_fr_plot) > 100:
+        
+        w, h=fig.get_size_inches()
+        h = len(sum_by_fr_plot)/10+1
+        fig.set_size_inches(1.5*h, h)
+        
+        for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
+            item.set_fontsize(20)
+            
+        ax.legend(sum_by_fr_plot.columns,loc='upper left',fontsize=20)
         
-       w, h=fig.get_size_inches()
-       h = len(sum_by_el_plot_b)/10+1
-       fig.set_size_inches(1.5*h, h)
-       
-       for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
-           item.set_fontsize(20)
-           
-       ax.legend(sum_by_el_plot_b.columns.get_level_values(1),loc='upper left',fontsize=20)
-      
     plt.tight_layout()
-    fig.savefig('el-cntrb-b.png',dpi=300)
+    fig.savefig('fr-cntrb-'+'ab'[spin_no]+'.png',dpi=300)
     plt.close(fig)
-# plot options for (alpha) orbitals start here:
-ax=sum_by_el_plot_a.plot.barh(xlim=(0,100),stacked=True)
-ax.legend(sum_by_el_plot_a.columns.get_level_values(1),loc='upper left')
-ax.set_title('Element contributions (>= 0%) to orbitals'+alpha_str+'.'
-             +f' The orbital number of the HOMO is {homo_num}.')
-ax.set_xlabel('Element contribution (%)')
-ax.set_ylabel('(Orbital No., Occupation)')
-
-# reduce some labels in large plots
-if len(sum_by_el_plot_a) > 30:
-    ax.set_yticklabels([t if not i%2 else "" for i,t in enumerate(ax.get_yticklabels())])
-    
-if len(sum_by_el_plot_a) > 50:
-    ax.set_yticklabels([t if not i%4 else "" for i,t in enumerate(ax.get_yticklabels())])
+
+###############################################################################
+# plot of the PDOS
+# pdos-a.png & pdos-b.png (if open shell)
+
+for spin_no, pdos_plot in pdos_tables.items():
+    if not plot_changed('pdos-'+'ab'[spin_no]+'.png', plot_key(pdos_plot, args.project, args.broadening,
+                                                             homo_num, alpha_str)):
+        continue
+    
+    fig, ax = plt.subplots()
+    ax.fill_between(pdos_plot.index, pdos_plot.Total, color='lightgray', label='Total')
+    pdos_plot.drop(columns=['Total']).plot(ax=ax, linewidth=0.8)
+    
+    # energy of the HOMO of this spin
+    e_homo_spin = orbitals[(orbitals.orb_spin == spin_no) & (orbitals.orb_occ > 0)].orb_en.max()
+    if not pd.isna(e_homo_spin):
+        ax.axvline(e_homo_spin * hartree_to_ev, color='black', linestyle='--', linewidth=0.8, label='HOMO')
+        
+    ax.set_title(f'PDOS ({args.project}, {args.broadening[0]} FWHM {args.broadening[1]*hartree_to_ev:.3f} eV)'
+                 +(alpha_str if spin_no == 0 else ' (beta)')+'.')
+    ax.set_xlabel('Energy (eV)')
+    ax.set_ylabel('PDOS (1/eV)')
+    ax.set_xlim(pdos_plot.index[0], pdos_plot.index[-1])
+    ax.set_ylim(bottom=0)
+    ax.legend(loc='upper left', ncol=1 + len(pdos_plot.columns) // 20)
     
-fig = ax.get_figure()
+    plt.tight_layout()
+    fig.savefig('pdos-'+'ab'[spin_no]+'.png',dpi=300)
+    plt.close(fig)
 
-# for very large plots of element contributions
-if len(sum_by_el_plot_a) > 100:
+###############################################################################
+# heat map of the differences of atom contributions (-d)
+# cmp-cntrb-a.png & cmp-cntrb-b.png (if open shell and compared with another ORCA output)
+
+for spin_no, cmp_plot in cmp_by_at.items():
+    cmp_plot = cmp_plot.droplevel(['OrbitalEnergy','OrbitalEnergy(B)'])
+    cmp_plot.columns = [str(atom).zfill(2) + ' ' + element for atom, element in cmp_plot.columns]
+    cmp_ano = bool(cmp_plot.size <= 300)
     
-    w, h=fig.get_size_inches()
-    h = len(sum_by_el_plot_a)/10+1
-    fig.set_size_inches(1.5*h, h)
+    if not plot_changed('cmp-cntrb-'+'ab'[spin_no]+'.png', plot_key(cmp_plot, cmp_str, args.align, 
+                        alpha_str, cmp_ano, hm_ano_font_size)):
+        continue
     
-    for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
-        item.set_fontsize(20)
-        
-    ax.legend(sum_by_el_plot_a.columns.get_level_values(1),loc='upper left',fontsize=20)
+    limit = max(cmp_plot.abs().values.max(), 0.1)
+    ax=sns.heatmap(data=cmp_plot,cmap='RdBu_r',vmin=-limit,vmax=limit,center=0,linecolor='black',
+       annot=cmp_ano,fmt='g',xticklabels=True,linewidths=0.5,cbar=True,annot_kws={"size": hm_ano_font_size})
+    
+    ax.invert_yaxis()
+    ax.set_title(f'Difference of atom contributions ({cmp_str}) to orbitals'
+                 +('' if args.compare_spins else (alpha_str, ' (beta)')[spin_no])
+                 +f', aligned by {args.align}.\n'
+                 f'The orbital number of the HOMO is {homo_num}.')
+    ax.set_xlabel('Atom No.')
+    ax.set_ylabel('Orbital No.-Orbital No. (B)')
     
-plt.tight_layout()
-fig.savefig('el-cntrb-a.png',dpi=300)
-plt.close(fig)
+    fig = ax.get_figure()
+    plt.xticks(rotation=90) 
+    plt.yticks(rotation=0) 
+    fig.tight_layout()
+    fig.savefig('cmp-cntrb-'+'ab'[spin_no]+'.png',dpi=300)
+    plt.close(fig)
 
 ###############################################################################
 # heat maps
@@ -877,23 +2801,25 @@ if len(sum_by_at_a[(sum_by_at_a.Cntrb >= threshold)]) != 0:
         print('Heat map annotations for atom contributions to orbitals are turned off.\n')
         heatmap_ano=False # no annotations 
 
-    # plot options for (alpha) orbitals start here:
-    ax=sns.heatmap(data=sum_by_at_plot_a,cmap='hot',linecolor='black',
-       annot=heatmap_ano,fmt='g',xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
+    if plot_changed('a-cntrb-a.png', plot_key(sum_by_at_plot_a, threshold, appl_constr, homo_num, alpha_str, 
+                                              heatmap_ano, hm_ano_font_size)):
+        # plot options for (alpha) orbitals start here:
+        ax=sns.heatmap(data=sum_by_at_plot_a,cmap='hot',linecolor='black',
+           annot=heatmap_ano,fmt='g',xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
     
-    ax.invert_yaxis()
-    ax.set_title(f'Atom contributions (>= {threshold}%) to orbitals'+alpha_str+f'. The orbital number of the HOMO is {homo_num}.\n'
-                 f'Applied constraints: '+appl_constr.translate({ord(c): None for c in "[]',"})+'\n'
-                 f'Contributions <= {threshold}% are "0" or "black" in the heat map.')
-    ax.set_xlabel('Atom No.')
-    ax.set_ylabel('Orbital No.-Occupation')
+        ax.invert_yaxis()
+        ax.set_title(f'Atom contributions (>= {threshold}%) to orbitals'+alpha_str+f'. The orbital number of the HOMO is {homo_num}.\n'
+                     f'Applied constraints: '+appl_constr.translate({ord(c): None for c in "[]',"})+'\n'
+                     f'Contributions <= {threshold}% are "0" or "black" in the heat map.')
+        ax.set_xlabel('Atom No.')
+        ax.set_ylabel('Orbital No.-Occupation')
     
-    fig = ax.get_figure()
-    plt.xticks(rotation=90) 
-    plt.yticks(rotation=0) 
-    fig.tight_layout()
-    fig.savefig('a-cntrb-a.png',dpi=300)
-    plt.close(fig)
+        fig = ax.get_figure()
+        plt.xticks(rotation=90) 
+        plt.yticks(rotation=0) 
+        fig.tight_layout()
+        fig.savefig('a-cntrb-a.png',dpi=300)
+        plt.close(fig)
 
 if spin == 1:
     # more or less same as above
@@ -906,22 +2832,24 @@ if spin == 1:
         sum_by_at_plot_b=sum_by_at_plot_b.set_index(['OrbNo','Occupation','Atom']).unstack().fillna(0)
         sum_by_at_plot_b.columns=sum_by_at_plot_b.columns.droplevel()
         
-        # plot options for beta orbitals start here:
-        ax=sns.heatmap(data=sum_by_at_plot_b,cmap='hot',linecolor='black',
-           annot=heatmap_ano,fmt='g',xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
-        ax.invert_yaxis()
-        ax.set_title(f'Atom contributions (>= {threshold}%) to orbitals (beta). The orbital number of the HOMO (alpha) is {homo_num}.\n'
-                     f'Applied constraints: '+appl_constr.translate({ord(c): None for c in "[]',"})+'\n'
-                     f'Contributions <= {threshold}% are "0" or "black" in the heat map.')
-        ax.set_xlabel('Atom No.')
-        ax.set_ylabel('Orbital No.-Occupation')
-    
-        fig = ax.get_figure()
-        plt.xticks(rotation=90) 
-        plt.yticks(rotation=0) 
-        fig.tight_layout()
-        fig.savefig('a-cntrb-b.png',dpi=300)
-        plt.close(fig)
+        if plot_changed('a-cntrb-b.png', plot_key(sum_by_at_plot_b, threshold, appl_constr, homo_num, 
+                                                  heatmap_ano, hm_ano_font_size)):
+            # plot options for beta orbitals start here:
+            ax=sns.heatmap(data=sum_by_at_plot_b,cmap='hot',linecolor='black',
+               annot=heatmap_ano,fmt='g',xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
+            ax.invert_yaxis()
+            ax.set_title(f'Atom contributions (>= {threshold}%) to orbitals (beta). The orbital number of the HOMO (alpha) is {homo_num}.\n'
+                         f'Applied constraints: '+appl_constr.translate({ord(c): None for c in "[]',"})+'\n'
+                         f'Contributions <= {threshold}% are "0" or "black" in the heat map.')
+            ax.set_xlabel('Atom No.')
+            ax.set_ylabel('Orbital No.-Occupation')
+    
+            fig = ax.get_figure()
+            plt.xticks(rotation=90) 
+            plt.yticks(rotation=0) 
+            fig.tight_layout()
+            fig.savefig('a-cntrb-b.png',dpi=300)
+            plt.close(fig)
  
 ###############################################################################
 # heat maps for AOs in orbitals
@@ -957,6 +2885,12 @@ if constr_for_atoms_set == True:
                 # heat map annotations on if turned off before and DataFrame size is < 200
                 if  hm_ao_in_orb_plot_a.size < 300:
                     heatmap_ano=True    # annotations on
+                
+                atom_name=hm_ao_in_orb_plot_a.columns[0].split('-')[0] # Element-AtomName for file name
+                if not plot_changed('ao-cntrb-'+atom_name+'-a.png', plot_key(hm_ao_in_orb_plot_a, threshold, homo_num, 
+                                    alpha_str, heatmap_ano, hm_ano_font_size)):
+                    continue
+                
                 # create the heatmap
                 ax=sns.heatmap(hm_ao_in_orb_plot_a,cmap='hot',linecolor='black',annot=heatmap_ano,fmt='g',
                                xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
@@ -973,7 +2907,6 @@ if constr_for_atoms_set == True:
                 #plt.xticks(rotation=90) 
                 plt.yticks(rotation=0) 
                 fig.tight_layout()
-                atom_name=hm_ao_in_orb_plot_a.columns[0].split('-')[0] # Element-AtomName for file name
                 fig.savefig('ao-cntrb-'+atom_name+'-a.png',dpi=300)
                 plt.close(fig)
             
@@ -1007,6 +2940,12 @@ if constr_for_atoms_set == True:
                     # heat map annotations on if turned off before and DataFrame size is < 300
                     if  hm_ao_in_orb_plot_b.size < 300:
                         heatmap_ano=True    # annotations on
+                    
+                    atom_name=hm_ao_in_orb_plot_b.columns[0].split('-')[0] # Element-AtomName for file name
+                    if not plot_changed('ao-cntrb-'+atom_name+'-b.png', plot_key(hm_ao_in_orb_plot_b, threshold, homo_num, 
+                                        alpha_str, heatmap_ano, hm_ano_font_size)):
+                        continue
+                    
                     # create the heatmap
                     ax=sns.heatmap(hm_ao_in_orb_plot_b,cmap='hot',linecolor='black',annot=heatmap_ano,fmt='g',
                                    xticklabels=True,linewidths=0.5,cbar=False,annot_kws={"size": hm_ano_font_size}) 
@@ -1023,6 +2962,22 @@ if constr_for_atoms_set == True:
                     #plt.xticks(rotation=90) 
                     plt.yticks(rotation=0) 
                     fig.tight_layout()
-                    atom_name=hm_ao_in_orb_plot_b.columns[0].split('-')[0] # Element-AtomName for file name
                     fig.savefig('ao-cntrb-'+atom_name+'-b.png',dpi=300)
                     plt.close(fig)
+
+###############################################################################
+# tidy up plots
+# delete all plots of previous runs that have not been created in this run
+# (and the PDOS tables, e.g. pdos-b.csv after an open shell run)
+# save the keys of the plots in the manifest
+
+for pattern in ('el-cntrb-?.png','fr-cntrb-?.png','pdos-?.png','cmp-cntrb-?.png','a-cntrb-?.png',
+                'ao-cntrb-*-?.png'):
+    for pngfiles in glob.glob(pattern):
+        if pngfiles not in plots_of_run:
+            ops.remove(pngfiles)
+for csvfiles in glob.glob('pdos-?.csv'):
+    if csvfiles not in ['pdos-'+'ab'[spin_no]+'.csv' for spin_no in pdos_tables]:
+        ops.remove(csvfiles)
+
+write_cache_record(plot_manifest_name, plots_of_run)